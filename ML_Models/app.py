@@ -1,25 +1,44 @@
 # Flask Web Server for ML Model
 # Save this as: app.py
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
 from flask_cors import CORS
 import sys
 import os
+import json
+import hmac
+import signal
+import threading
+import time
+from time import perf_counter
 
 # Import your model (make sure model.py is in same directory)
 try:
-    from model import InteractiveMLModel
+    from model import InteractiveMLModel, COMPILED_MAX_ROWS
 except ImportError:
     print("❌ Error: Cannot import model.py")
     print("Make sure model.py is in the same directory as app.py")
     sys.exit(1)
 
+from artifacts import DEFAULT_ARTIFACT_DIR, bundle_generation
+from drift import DriftMonitor, load_or_build_baseline
+from memory_usage import process_memory
+from metrics import REGISTRY, REQUESTS, ERRORS, REQUEST_LATENCY, STAGE_LATENCY
+from micro_batching import MicroBatcher
+from profiling import profiled
+from request_decoding import RequestDecoder, loads
+from response_encoding import encode_result, encode_batch, encode_ndjson
+from score_index import load_or_build_index
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for cross-origin requests
 
 # Initialize the model
 ml_model = InteractiveMLModel()
 
+# Typed /predict body decoder built from the model's feature schema
+request_decoder = RequestDecoder(ml_model)
+
 
 # Load your trained models (uncomment and update paths)
 # ml_model.load_trained_models(
@@ -28,18 +47,288 @@ ml_model = InteractiveMLModel()
 #     scaler_path='scaler_X_train.pkl'
 # )
 
+# Load the cached model artifacts (training and caching them once if missing) and
+# run a warm-up prediction so cold start never lands on real traffic
+if os.environ.get('ML_SKIP_WARMUP') != '1':
+    ml_model.warm_up()
+
+# The sklearn models behind large batches are otherwise read on first use; with
+# gunicorn --preload, ML_EAGER_ARTIFACTS=1 reads them before the workers fork
+if os.environ.get('ML_EAGER_ARTIFACTS') == '1':
+    ml_model.load_deferred_artifacts()
+
+# Portfolio percentile index: every prediction reports its percentile and credit band
+# against the portfolio as scored by the served models (built from
+# beneficiary_dataset_preprocessed.csv, or saved by bulk_score; rebuilt whenever the
+# models change; disable with ML_SCORE_INDEX=0)
+SCORE_INDEX_ENABLED = os.environ.get('ML_SCORE_INDEX', '1') != '0'
+if SCORE_INDEX_ENABLED:
+    ml_model.set_score_index(load_or_build_index(ml_model))
+
+# Feature drift monitoring: scored inputs are counted over a sliding window and
+# compared with a baseline from the training data on GET /drift and /metrics
+# (window ML_DRIFT_WINDOW_SECONDS in ML_DRIFT_SLOTS steps, recomputed at most every
+# ML_DRIFT_REFRESH_SECONDS; disable with ML_DRIFT_MONITOR=0)
+drift_monitor = None
+if os.environ.get('ML_DRIFT_MONITOR', '1') != '0':
+    drift_baseline = load_or_build_baseline(ml_model)
+    if drift_baseline is not None:
+        drift_monitor = DriftMonitor(
+            drift_baseline,
+            window_seconds=float(os.environ.get('ML_DRIFT_WINDOW_SECONDS', 3600)),
+            slots=int(os.environ.get('ML_DRIFT_SLOTS', 12)),
+            refresh_seconds=float(os.environ.get('ML_DRIFT_REFRESH_SECONDS', 60))
+        )
+        ml_model.set_drift_monitor(drift_monitor)
+        REGISTRY.add_collector(drift_monitor.collect_metrics)
+
 @app.route('/')
 def index():
     """Serve the main HTML page"""
     return render_template('index.html')
 
 
+# Optional result cache for repeated applicant profiles
+# (enable with ML_PREDICTION_CACHE_SIZE=<entries>; ML_PREDICTION_CACHE_TTL=<seconds>)
+if int(os.environ.get('ML_PREDICTION_CACHE_SIZE', 0)) > 0:
+    ml_model.enable_prediction_cache(
+        max_entries=int(os.environ['ML_PREDICTION_CACHE_SIZE']),
+        ttl_seconds=float(os.environ.get('ML_PREDICTION_CACHE_TTL', 0)) or None
+    )
+
+# Optional micro-batching: concurrent /predict calls are queued for a short window
+# and scored together (enable with ML_MICROBATCH=1; use a threaded server/worker).
+# Batches default to the largest size the compiled tree engine handles
+micro_batcher = None
+if os.environ.get('ML_MICROBATCH') == '1':
+    micro_batcher = MicroBatcher(
+        ml_model.predict_batch,
+        max_batch_size=int(os.environ.get('ML_MICROBATCH_MAX_SIZE', COMPILED_MAX_ROWS)),
+        max_wait_ms=float(os.environ.get('ML_MICROBATCH_WAIT_MS', 2.0))
+    )
+
+# Upper bound on rows accepted by /predict/batch in one request
+MAX_BATCH_SIZE = int(os.environ.get('ML_MAX_BATCH_SIZE', 50000))
+
+# Rows scored per step when /predict/batch streams NDJSON (Accept: application/x-ndjson)
+STREAM_CHUNK_ROWS = int(os.environ.get('ML_STREAM_CHUNK_ROWS', 2048))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Shared secret for the admin endpoints, sent as X-Admin-Token (they are disabled when unset)
+ADMIN_TOKEN = os.environ.get('ML_ADMIN_TOKEN')
+
+# Directories a reload may read model files from
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RELOAD_ROOTS = [BASE_DIR, DEFAULT_ARTIFACT_DIR]
+
+# Signal that makes a process reload its models from DEFAULT_ARTIFACT_DIR
+# (with gunicorn, send it to the workers: pkill -USR2 -P <master pid>). Windows
+# has no SIGUSR2; there the bundle watcher and POST /admin/reload still reload
+RELOAD_SIGNAL = getattr(signal, 'SIGUSR2', None)
+
+# Seconds between checks for a bundle published by another worker (0 disables them)
+BUNDLE_POLL_SECONDS = float(os.environ.get('ML_BUNDLE_POLL_SECONDS', 5))
+
+# Progress of the last background reload, reported by GET /admin/reload
+reload_state = {'status': 'idle', 'source': None, 'started_at': None, 'finished_at': None, 'error': None}
+reload_lock = threading.Lock()
+
+# Content type of the Prometheus text exposition format served by /metrics
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PARSE_LATENCY = STAGE_LATENCY.labels('parse')
+
+
+def coerce_input_types(data):
+    """Convert string numbers in a request payload to appropriate types"""
+    processed_data = {}
+    for key, value in data.items():
+        if key in ['region', 'education_level', 'occupation']:
+            processed_data[key] = str(value)
+        else:
+            try:
+                # Try to convert to number
+                if '.' in str(value):
+                    processed_data[key] = float(value)
+                else:
+                    processed_data[key] = int(value)
+            except (ValueError, TypeError):
+                processed_data[key] = value
+    return processed_data
+
+
+def read_json_body():
+    """JSON body of the request, parsed with the fast decoder when possible"""
+    if request.is_json:
+        try:
+            return loads(request.get_data(cache=True))
+        except ValueError:
+            pass
+    # Anything the fast parser rejects gets Flask's own parsing (and error) as before
+    return request.get_json()
+
+
+def json_text_response(payload, text):
+    """Response for an already encoded JSON body; in debug mode jsonify pretty-prints payload instead"""
+    compact = app.json.compact
+    if compact is False or (compact is None and app.debug):
+        return jsonify(payload)
+    return app.response_class(text + '\n', mimetype=app.json.mimetype)
+
+
+def wants_ndjson():
+    """Whether the client asked for a streamed NDJSON batch response"""
+    return (request.args.get('format') == 'ndjson'
+            or any(mimetype == NDJSON_MIMETYPE for mimetype, _ in request.accept_mimetypes))
+
+
+def parse_batch_body():
+    """Read a batch request body as a JSON array or as NDJSON (one object per line)"""
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        lines = request.get_data(as_text=True).splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'records' in data:
+        data = data['records']
+    return data
+
+
+def admin_denied():
+    """Error response if the request does not carry the admin token, otherwise None"""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'errors': ['Admin endpoints are disabled (set ML_ADMIN_TOKEN)']}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'success': False, 'errors': ['Invalid admin token']}), 401
+    return None
+
+
+def resolve_reload_source(body):
+    """Reload arguments from a request body; model files must live under RELOAD_ROOTS"""
+    source = {}
+    for key in ('cache_dir', 'default_model_path', 'income_model_path', 'scaler_path'):
+        value = body.get(key)
+        if value is None:
+            continue
+        path = os.path.realpath(os.path.join(BASE_DIR, str(value)))
+        if not any(os.path.commonpath([path, os.path.realpath(root)]) == os.path.realpath(root)
+                   for root in RELOAD_ROOTS):
+            raise ValueError(f'{key} must be inside {BASE_DIR} or {DEFAULT_ARTIFACT_DIR}')
+        source[key] = path
+
+    # By default the current artifact bundle is reloaded
+    if not source:
+        source['cache_dir'] = DEFAULT_ARTIFACT_DIR
+    return source
+
+
+def run_reload(source):
+    """Background job: load and smoke-test new models, then swap them in"""
+    try:
+        ml_model.reload_models(**source)
+        refresh_score_index()
+        status, error = 'succeeded', None
+    except Exception as e:
+        print(f"❌ Model reload failed: {type(e).__name__}: {e}")
+        status, error = 'failed', f"{type(e).__name__}: {e}"
+
+    with reload_lock:
+        reload_state.update(status=status, error=error, finished_at=time.time())
+
+
+def refresh_score_index():
+    """After a model swap: use the index of the new models, loading a saved one (e.g. by bulk_score) or building it"""
+    if not SCORE_INDEX_ENABLED:
+        return
+    # A stale index would rank scores of the new models against those of the old ones
+    index = load_or_build_index(ml_model)
+    ml_model.set_score_index(index)
+    if index is not None:
+        print(f"📈 Score index reloaded ({len(index)} scores)")
+
+
+def start_reload(source):
+    """Start a background reload; returns False if one is already running"""
+    with reload_lock:
+        if reload_state['status'] == 'running':
+            return False
+        reload_state.update(status='running', source=source, started_at=time.time(), finished_at=None, error=None)
+
+    threading.Thread(target=run_reload, args=(source,), name='model-reload', daemon=True).start()
+    return True
+
+
+def watch_bundle():
+    """Background loop: reload when a new bundle generation is published (e.g. by /models/update in another worker)"""
+    key = ml_model.artifact_key()
+    seen = bundle_generation(DEFAULT_ARTIFACT_DIR, key)
+    while True:
+        time.sleep(BUNDLE_POLL_SECONDS)
+        generation = bundle_generation(DEFAULT_ARTIFACT_DIR, key)
+        if generation is None or generation == seen:
+            continue
+        # A reload already running is retried at the next check
+        if generation == ml_model.artifact_generation or start_reload({'cache_dir': DEFAULT_ARTIFACT_DIR}):
+            seen = generation
+
+
+def start_bundle_watcher():
+    """Follow bundles published by other workers, in a daemon thread"""
+    if BUNDLE_POLL_SECONDS > 0:
+        threading.Thread(target=watch_bundle, name='bundle-watcher', daemon=True).start()
+
+
+def install_reload_signal():
+    """Reload the artifact bundle in the background when RELOAD_SIGNAL arrives (where the platform has it)"""
+    if RELOAD_SIGNAL is None:
+        return
+    signal.signal(RELOAD_SIGNAL, lambda signum, frame: start_reload({'cache_dir': DEFAULT_ARTIFACT_DIR}))
+
+
+def collect_service_stats():
+    """Prediction cache and micro-batcher counters, read when /metrics is scraped"""
+    cache = ml_model.prediction_cache
+    if cache is not None:
+        stats = cache.stats()
+        for key in ('hits', 'misses', 'evictions', 'expirations'):
+            yield f'ml_prediction_cache_{key}_total', 'counter', f'Prediction cache {key}', [([], stats[key])]
+        yield 'ml_prediction_cache_entries', 'gauge', 'Entries held by the prediction cache', [([], stats['size'])]
+        yield 'ml_prediction_cache_hit_rate', 'gauge', 'Fraction of cache lookups that hit', [([], stats['hit_rate'])]
+    if micro_batcher is not None:
+        stats = micro_batcher.stats()
+        yield 'ml_microbatch_batches_total', 'counter', 'Micro-batches scored', [([], stats['batches'])]
+        yield 'ml_microbatch_items_total', 'counter', 'Requests scored through micro-batches', [([], stats['items'])]
+
+
+REGISTRY.add_collector(collect_service_stats)
+
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for the latency histogram"""
+    request.environ['ml.start'] = perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Count every response and time it by route (the URL rule, so label values stay bounded)"""
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUESTS.labels(endpoint, response.status_code).inc()
+    start = request.environ.get('ml.start')
+    if start is not None:
+        REQUEST_LATENCY.labels(endpoint).observe(perf_counter() - start)
+    if response.status_code >= 400:
+        ERRORS.labels(f'http_{response.status_code}').inc()
+    return response
+
+
 @app.route('/predict', methods=['POST'])
+@profiled
 def predict():
     """Handle prediction requests from the web interface"""
     try:
         # Get JSON data from the request
-        data = request.get_json()
+        start = perf_counter()
+        data = read_json_body()
 
         if not data:
             return jsonify({
@@ -47,25 +336,33 @@ def predict():
                 'errors': ['No data provided']
             }), 400
 
-        # Convert string numbers to appropriate types
-        processed_data = {}
-        for key, value in data.items():
-            if key in ['region', 'education_level', 'occupation']:
-                processed_data[key] = str(value)
-            else:
-                try:
-                    # Try to convert to number
-                    if '.' in str(value):
-                        processed_data[key] = float(value)
-                    else:
-                        processed_data[key] = int(value)
-                except (ValueError, TypeError):
-                    processed_data[key] = value
+        # Decode straight into the model's typed row; unusual payloads are re-read
+        # and converted by the generic path
+        processed_data = request_decoder.decode(data)
+        if processed_data is None:
+            processed_data = coerce_input_types(request.get_json())
+        PARSE_LATENCY.observe(perf_counter() - start)
 
         # Make prediction using your model
-        result = ml_model.predict(processed_data)
+        # Profiled requests are scored on this thread so the trace covers the model call
+        if micro_batcher is not None and not g.get('profiling'):
+            result = micro_batcher.submit(processed_data)
+        else:
+            result = ml_model.predict(processed_data)
 
-        return jsonify(result)
+        # ?explain=1 adds the per-feature contributions behind the scores
+        if request.args.get('explain') == '1' and result.get('success'):
+            try:
+                explanation = ml_model.explain(processed_data)['explanation']
+            except ValueError as e:
+                # The served models cannot be explained (not tree ensembles)
+                return jsonify({
+                    'success': False,
+                    'errors': [str(e)]
+                }), 400
+            result = dict(result, explanation=explanation)
+
+        return json_text_response(result, encode_result(result))
 
     except Exception as e:
         return jsonify({
@@ -74,21 +371,210 @@ def predict():
         }), 500
 
 
+@app.route('/predict/batch', methods=['POST'])
+@profiled
+def predict_batch():
+    """Score a whole cohort of beneficiaries (JSON array or NDJSON body) in one call"""
+    try:
+        try:
+            data = parse_batch_body()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'errors': [f'Invalid NDJSON body: {str(e)}']
+            }), 400
+
+        if not data or not isinstance(data, list):
+            return jsonify({
+                'success': False,
+                'errors': ['Expected a non-empty JSON array or NDJSON body of records']
+            }), 400
+
+        if len(data) > MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'errors': [f'Batch too large: {len(data)} records (max {MAX_BATCH_SIZE})']
+            }), 413
+
+        # Convert string numbers to appropriate types; non-object rows fail validation per row
+        coerce = lambda rows: [coerce_input_types(row) if isinstance(row, dict) else {} for row in rows]
+
+        if wants_ndjson():
+            # One result per line, scored and sent a chunk at a time so the response
+            # is never held in memory as a whole
+            def stream():
+                for start in range(0, len(data), STREAM_CHUNK_ROWS):
+                    yield encode_ndjson(ml_model.predict_batch(coerce(data[start:start + STREAM_CHUNK_ROWS])))
+
+            return app.response_class(stream(), mimetype=NDJSON_MIMETYPE, headers={'X-Record-Count': str(len(data))})
+
+        # Score every row with one vectorized pass through the models
+        results = ml_model.predict_batch(coerce(data))
+
+        payload = {
+            'success': True,
+            'count': len(results),
+            'results': results
+        }
+        return json_text_response(payload, encode_batch(results))
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'errors': [f'Server error: {str(e)}']
+        }), 500
+
+
+@app.route('/models/update', methods=['POST'])
+def update_models():
+    """Learn newly repaid / defaulted loans (records with a default_flag) and hot-swap the models"""
+    # Updates this worker's models on top of the published artifact bundle and
+    # publishes the result (see InteractiveMLModel.publish_update); the other
+    # gunicorn workers pick it up through watch_bundle, and reloads and restarts
+    # start from it
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+
+    try:
+        try:
+            data = parse_batch_body()
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'errors': [f'Invalid NDJSON body: {str(e)}']
+            }), 400
+
+        if not data or not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+            return jsonify({
+                'success': False,
+                'errors': ['Expected a non-empty JSON array or NDJSON body of records']
+            }), 400
+
+        if len(data) > MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'errors': [f'Batch too large: {len(data)} records (max {MAX_BATCH_SIZE})']
+            }), 413
+
+        labels = [str(row.get('default_flag')) for row in data]
+        if any(label not in ('0', '1') for label in labels):
+            return jsonify({
+                'success': False,
+                'errors': ['Every record needs a default_flag of 0 or 1']
+            }), 400
+
+        records = [coerce_input_types(row) for row in data]
+        generation = ml_model.artifact_generation
+        learned, pending, persisted = ml_model.publish_update(records, [int(label) for label in labels],
+                                                             DEFAULT_ARTIFACT_DIR)
+        if learned or ml_model.artifact_generation != generation:
+            refresh_score_index()
+
+        return jsonify({
+            'success': True,
+            'received': len(records),
+            'learned': learned,
+            'pending': pending,
+            'persisted': persisted,
+            'artifact_generation': ml_model.artifact_generation
+        })
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'errors': [str(e)]
+        }), 400
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'errors': [f'Server error: {str(e)}']
+        }), 500
+
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def reload_models():
+    """Reload the models in the background (POST) or report the last reload (GET)"""
+    # Requests keep being served by the current models until the new ones pass the smoke test
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+
+    if request.method == 'GET':
+        with reload_lock:
+            return jsonify({'success': True, 'reload': dict(reload_state)})
+
+    try:
+        source = resolve_reload_source(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'errors': [str(e)]
+        }), 400
+
+    if not start_reload(source):
+        return jsonify({
+            'success': False,
+            'errors': ['A reload is already running']
+        }), 409
+
+    with reload_lock:
+        return jsonify({'success': True, 'reload': dict(reload_state)}), 202
+
+
+def score_index_info():
+    """Size and origin of the live score index, for /health"""
+    index = ml_model.score_index
+    if index is None:
+        return None
+    return {'scores': len(index), 'source': index.source, 'models': index.models,
+            'credit_bands': dict(zip(index.categories, index.edges + [None]))}
+
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'model_trained': ml_model.models_trained,
-        'features_count': len(ml_model.feature_definitions)
+        'model_engine': ml_model.engine,
+        'features_count': len(ml_model.feature_definitions),
+        'worker_memory': process_memory(),
+        'micro_batching': micro_batcher.stats() if micro_batcher is not None else None,
+        'prediction_cache': ml_model.prediction_cache.stats() if ml_model.prediction_cache is not None else None,
+        'score_index': score_index_info()
     })
 
 
+@app.route('/drift')
+def drift():
+    """Feature drift of the recent scored inputs against the training data (this worker process)"""
+    if drift_monitor is None:
+        return jsonify({
+            'success': False,
+            'errors': ['Drift monitoring is disabled (ML_DRIFT_MONITOR=0 or no training data)']
+        }), 404
+
+    # ?refresh=1 recomputes now instead of serving the last periodic report
+    max_age = 0 if request.args.get('refresh') == '1' else None
+    return jsonify({'success': True, 'drift': drift_monitor.report(max_age)})
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (counters and histograms of this worker process)"""
+    return app.response_class(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
 if __name__ == '__main__':
     print("🚀 Starting ML Model Web Server...")
     print("📊 Model Features:", len(ml_model.feature_definitions))
     print("🌐 Server will be available at: http://localhost:5000")
     print("💡 Press Ctrl+C to stop the server")
 
+    install_reload_signal()
+    start_bundle_watcher()
+
     # Run the Flask app
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,295 @@
+# On-disk artifact bundles for the ML model
+# A bundle holds the fitted models, scaler and compiled tree arrays (the encoder
+# classes live in its manifest), keyed by a hash of the feature schema so a
+# schema change invalidates it. Files can be left unread until first use, so a
+# serving process only unpickles what its requests touch.
+#
+# Each write goes to its own generation directory and bundle-<key> is a symlink
+# to the published one, so a bundle can be replaced (e.g. after a model update)
+# while other processes still read files of the generation they loaded. Those
+# processes hold a shared lock on its manifest until their deferred files are
+# read, and old generations are only deleted once nobody holds one.
+# Processes that change a published bundle serialise on bundle_lock. Labelled
+# rows waiting to be learned by a model update are kept next to the bundle.
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib import metadata
+
+import joblib
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: file locks come from msvcrt instead
+    fcntl = None
+    import msvcrt
+
+# Bump when the bundle layout changes
+ARTIFACT_VERSION = 6
+
+# Default location of cached bundles (override with ML_ARTIFACT_DIR)
+DEFAULT_ARTIFACT_DIR = os.environ.get(
+    'ML_ARTIFACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache'))
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def sklearn_version():
+    """Installed scikit-learn version, read without importing sklearn"""
+    module = sys.modules.get('sklearn')
+    if module is not None:
+        return module.__version__
+    return metadata.version('scikit-learn')
+
+
+def schema_hash(feature_definitions, feature_order, engine='classic'):
+    """Stable hash of the feature schema, model engine, bundle format and sklearn version"""
+    schema = {
+        'artifact_version': ARTIFACT_VERSION,
+        'sklearn_version': sklearn_version(),
+        'engine': engine,
+        'feature_definitions': feature_definitions,
+        'feature_order': feature_order,
+    }
+    payload = json.dumps(schema, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def bundle_path(cache_dir, key):
+    """Published bundle for a schema hash (a symlink to its current generation)"""
+    return os.path.join(cache_dir, f'bundle-{key}')
+
+
+def generation_path(cache_dir, key, generation):
+    """Directory holding one generation of a bundle"""
+    return f'{bundle_path(cache_dir, key)}@{generation}'
+
+
+def bundle_generation(cache_dir, key):
+    """Generation the bundle of a schema hash currently points to, or None if none is published"""
+    try:
+        target = os.readlink(bundle_path(cache_dir, key))
+    except OSError:
+        return None
+    return target.rpartition('@')[2]
+
+
+@contextmanager
+def bundle_lock(cache_dir, key):
+    """Hold an exclusive lock on the bundle of a schema hash across processes, waiting until it is free"""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f'{bundle_path(cache_dir, key)}.lock', 'a+b') as f:
+        if fcntl is not None:
+            # Released when the file is closed
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+            return
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                # LK_LOCK gives up after about 10 seconds; keep waiting
+                continue
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_bundle(cache_dir, key, objects, extra=None, replace=False):
+    """Write and publish a bundle atomically; objects maps artifact name -> object, extra adds manifest entries
+
+    Unless replace is set an already published bundle is kept, so processes that
+    train concurrently on a cold start agree on one. Replacing keeps the previous
+    generation on disk for processes that have not reloaded yet; older ones are deleted.
+    """
+    generation = f'{time.time_ns()}-{os.getpid()}'
+    path = generation_path(cache_dir, key, generation)
+    os.makedirs(path)
+
+    # Uncompressed dumps so arrays can be memory-mapped on load
+    files = {}
+    for name, obj in objects.items():
+        filename = f'{name}.joblib'
+        joblib.dump(obj, os.path.join(path, filename))
+        files[name] = filename
+
+    manifest = {
+        'artifact_version': ARTIFACT_VERSION,
+        'schema_hash': key,
+        'generation': generation,
+        'sklearn_version': sklearn_version(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'files': files,
+    }
+    manifest.update(extra or {})
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    final_path = bundle_path(cache_dir, key)
+    previous = bundle_generation(cache_dir, key)
+    target = os.path.basename(path)
+    if not replace:
+        try:
+            os.symlink(target, final_path)
+        except FileExistsError:
+            # Another process published the same bundle first; keep theirs
+            shutil.rmtree(path, ignore_errors=True)
+        return final_path
+
+    link = f'{final_path}.tmp-{os.getpid()}'
+    os.symlink(target, link)
+    os.replace(link, final_path)
+    if previous is not None:
+        remove_generations(cache_dir, key, older_than=generation)
+    return final_path
+
+
+def remove_generations(cache_dir, key, older_than):
+    """Delete the generation directories of a bundle written before generation older_than that no process holds
+
+    Without fcntl (Windows) a generation's holders cannot be told apart, so none are deleted.
+    """
+    if fcntl is None:
+        return
+    # Generations start with their write time; newer ones may still be being written
+    prefix = os.path.basename(bundle_path(cache_dir, key)) + '@'
+    cutoff = int(older_than.partition('-')[0])
+    for name in os.listdir(cache_dir):
+        if not name.startswith(prefix) or int(name[len(prefix):].partition('-')[0]) >= cutoff:
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            f = open(os.path.join(path, MANIFEST_FILE), 'rb')
+        except OSError:
+            # No manifest, so no process can have loaded it
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # A process still has files of this generation left to read
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def hold_generation(path):
+    """Shared lock keeping the generation directory at path from being deleted while the returned file is open
+
+    Returns None where generations are never deleted (no fcntl), and raises
+    FileNotFoundError if the generation was deleted before the lock was taken.
+    """
+    if fcntl is None:
+        return None
+    f = open(os.path.join(path, MANIFEST_FILE), 'rb')
+    fcntl.flock(f, fcntl.LOCK_SH)
+    # remove_generations may have deleted it while holding its exclusive lock
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        f.close()
+        raise FileNotFoundError(f"Bundle generation {path} was removed")
+    return f
+
+
+def pending_path(cache_dir, key):
+    """Update rows buffered for the bundle of a schema hash"""
+    return f'{bundle_path(cache_dir, key)}.pending.joblib'
+
+
+def read_pending(cache_dir, key):
+    """Buffered update rows of a bundle, or None if there are none"""
+    try:
+        return joblib.load(pending_path(cache_dir, key))
+    except FileNotFoundError:
+        return None
+
+
+def write_pending(cache_dir, key, pending):
+    """Replace the buffered update rows of a bundle atomically (None removes them)"""
+    path = pending_path(cache_dir, key)
+    if pending is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    tmp = f'{path}.tmp-{os.getpid()}'
+    joblib.dump(pending, tmp)
+    os.replace(tmp, path)
+
+
+def read_manifest(cache_dir, key):
+    """Manifest of a published bundle, or None if missing or stale"""
+    path = bundle_path(cache_dir, key)
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('schema_hash') != key or manifest.get('artifact_version') != ARTIFACT_VERSION:
+        return None
+    return manifest
+
+
+class LazyArtifact:
+    """A bundle file that is unpickled the first time load() is called"""
+
+    _MISSING = object()
+
+    def __init__(self, path, mmap_mode='r', hold=None):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        # Lock of hold_generation, shared by the artifacts of one bundle and released
+        # once none of them is left unread
+        self._hold = hold
+        self._value = self._MISSING
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._value is self._MISSING:
+            with self._lock:
+                if self._value is self._MISSING:
+                    self._value = joblib.load(self.path, mmap_mode=self.mmap_mode)
+                    self._hold = None
+        return self._value
+
+
+def resolve(artifact):
+    """The object behind a LazyArtifact (loading it if needed); anything else is returned as is"""
+    if type(artifact) is LazyArtifact:
+        return artifact.load()
+    return artifact
+
+
+def read_bundle(cache_dir, key, mmap_mode='r', lazy=(), manifest=None):
+    """Load the artifacts of a bundle (arrays memory-mapped); returns None if unavailable
+
+    Artifacts named in lazy are returned as LazyArtifacts and only read on first use.
+    """
+    if manifest is None:
+        manifest = read_manifest(cache_dir, key)
+    if manifest is None:
+        return None
+
+    # Files come from the manifest's generation even if a newer one is published meanwhile
+    path = generation_path(cache_dir, key, manifest['generation'])
+    try:
+        hold = hold_generation(path) if any(name in lazy for name in manifest['files']) else None
+    except FileNotFoundError:
+        return None
+    return {
+        name: (LazyArtifact(os.path.join(path, filename), mmap_mode, hold) if name in lazy
+               else joblib.load(os.path.join(path, filename), mmap_mode=mmap_mode))
+        for name, filename in manifest['files'].items()
+    }
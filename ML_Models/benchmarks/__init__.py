@@ -0,0 +1 @@
+# Benchmarks for the ML model service (run from ML_Models: python -m benchmarks.<name>)
@@ -0,0 +1,74 @@
+# Scaling benchmark for parallel bulk scoring
+# Usage (from ML_Models): python -m benchmarks.bench_bulk_scaling [--repeat 10] [--workers 1 2 4 8]
+#
+# Builds a larger portfolio by repeating beneficiary_dataset_preprocessed.csv, scores
+# it with bulk_score at several worker counts and reports rows/s and speedup.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from bulk_score import bulk_score
+from model import InteractiveMLModel
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'beneficiary_dataset_preprocessed.csv')
+
+
+def default_worker_counts():
+    counts, n = [], 1
+    while n < os.cpu_count():
+        counts.append(n)
+        n *= 2
+    return counts + [os.cpu_count()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk scoring scaling benchmark')
+    parser.add_argument('--repeat', type=int, default=10, help='copies of the 20k-row dataset to score')
+    parser.add_argument('--workers', type=int, nargs='+', default=default_worker_counts())
+    parser.add_argument('--chunksize', type=int, default=20000)
+    parser.add_argument('--json', default=None, help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    # Make sure artifacts are cached so workers only pay for loading them
+    InteractiveMLModel().load_or_train_models()
+
+    workdir = tempfile.mkdtemp(prefix='bulk-bench-')
+    try:
+        source = pd.read_csv(DATASET)
+        input_path = os.path.join(workdir, 'portfolio.csv')
+        pd.concat([source] * args.repeat, ignore_index=True).to_csv(input_path, index=False)
+        n_rows = len(source) * args.repeat
+
+        results = []
+        for workers in args.workers:
+            start = time.perf_counter()
+            bulk_score(input_path, os.path.join(workdir, f'scores-{workers}.csv'),
+                       chunksize=args.chunksize, workers=workers)
+            elapsed = time.perf_counter() - start
+            results.append({'workers': workers, 'seconds': round(elapsed, 3),
+                            'rows_per_second': round(n_rows / elapsed)})
+
+        baseline = results[0]['seconds']
+        print(f"\n📊 Bulk scoring {n_rows} rows on {os.cpu_count()} CPU cores")
+        print(f"{'workers':>8} {'seconds':>9} {'rows/s':>10} {'speedup':>8}")
+        for row in results:
+            row['speedup'] = round(baseline / row['seconds'], 2)
+            print(f"{row['workers']:>8} {row['seconds']:>9.2f} {row['rows_per_second']:>10} {row['speedup']:>8.2f}")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'rows': n_rows, 'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
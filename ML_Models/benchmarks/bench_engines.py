@@ -0,0 +1,124 @@
+# Model engine comparison: classic (random forest + gradient boosting) vs hist
+# Usage (from ML_Models): python -m benchmarks.bench_engines [--engines classic hist] [--json engines.json]
+#
+# Trains both models of each engine on beneficiary_dataset_preprocessed.csv (80/20
+# stratified split) and reports fit time, single-row latency, batch throughput and
+# hold-out accuracy / ROC AUC.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from model import InteractiveMLModel, INCOME_BANDS, MODEL_ENGINES, make_models
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'beneficiary_dataset_preprocessed.csv')
+
+
+def load_data(path):
+    """Validated input rows with default and income band labels"""
+    frame = pd.read_csv(path)
+    frame = frame[~InteractiveMLModel().validate_frame(frame)].reset_index(drop=True)
+    y_default = frame['default_flag'].to_numpy().astype(int)
+    y_income = frame['income_band'].map(INCOME_BANDS.index).to_numpy().astype(int)
+    return frame, y_default, y_income
+
+
+def median_seconds(fn, repeat):
+    """Median wall time of fn() over repeat calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def bench_engine(engine, frame, train_idx, test_idx, y_default, y_income, single_repeat, batch_repeat):
+    """Fit one engine on the training split and measure it; returns a result row"""
+    model = InteractiveMLModel(engine)
+    X = model.build_feature_matrix(frame)
+    model.scaler = StandardScaler()
+    X_train = model.scaler.fit_transform(X[train_idx])
+    X_test = model.scaler.transform(X[test_idx])
+    model.default_model, model.income_model = make_models(engine)
+
+    start = time.perf_counter()
+    model.default_model.fit(X_train, y_default[train_idx])
+    default_fit = time.perf_counter() - start
+    start = time.perf_counter()
+    model.income_model.fit(X_train, y_income[train_idx])
+    income_fit = time.perf_counter() - start
+
+    model.models_trained = True
+    model.compile_models()
+
+    default_proba = model.default_model.predict_proba(X_test)[:, 1]
+    income_proba = model.income_model.predict_proba(X_test)
+
+    rows = frame.iloc[test_idx][list(model.feature_definitions)].to_dict('records')
+    row = rows[0]
+    test_frame = frame.iloc[test_idx]
+    single_sklearn = median_seconds(
+        lambda: (model.default_model.predict_proba(X_test[:1]), model.income_model.predict_proba(X_test[:1])),
+        single_repeat)
+    single_predict = median_seconds(lambda: model.predict(row), single_repeat)
+    batch = median_seconds(lambda: model.score_frame(test_frame), batch_repeat)
+
+    return {
+        'engine': engine,
+        'default_model': type(model.default_model).__name__,
+        'income_model': type(model.income_model).__name__,
+        'compiled': model._fast_default_model is not None and model._fast_income_model is not None,
+        'fit_seconds': {'default': round(default_fit, 3), 'income': round(income_fit, 3)},
+        'single_row_ms': {'sklearn': round(single_sklearn * 1e3, 3), 'predict': round(single_predict * 1e3, 3)},
+        'batch_rows_per_second': round(len(test_idx) / batch),
+        'default_auc': round(float(roc_auc_score(y_default[test_idx], default_proba)), 4),
+        'default_accuracy': round(float(accuracy_score(y_default[test_idx], default_proba > 0.5)), 4),
+        'income_auc': round(float(roc_auc_score(y_income[test_idx], income_proba, multi_class='ovr')), 4),
+        'income_accuracy': round(float(accuracy_score(y_income[test_idx], np.argmax(income_proba, axis=1))), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the classic and hist model engines')
+    parser.add_argument('--data', default=DATASET, help='labelled beneficiary CSV')
+    parser.add_argument('--engines', nargs='+', default=list(MODEL_ENGINES), choices=MODEL_ENGINES)
+    parser.add_argument('--single-repeat', type=int, default=200, help='timed single-row predictions')
+    parser.add_argument('--batch-repeat', type=int, default=5, help='timed hold-out batch scorings')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', default=None, help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    frame, y_default, y_income = load_data(args.data)
+    train_idx, test_idx = train_test_split(np.arange(len(frame)), test_size=0.2, stratify=y_default,
+                                           random_state=args.seed)
+
+    results = [bench_engine(engine, frame, train_idx, test_idx, y_default, y_income,
+                            args.single_repeat, args.batch_repeat) for engine in args.engines]
+
+    print(f"\n📊 {len(train_idx)} training rows, {len(test_idx)} hold-out rows")
+    print(f"{'engine':>8} {'fit s':>7} {'sk 1-row ms':>12} {'predict ms':>11} {'batch rows/s':>13} "
+          f"{'def AUC':>8} {'def acc':>8} {'inc AUC':>8} {'inc acc':>8}")
+    for row in results:
+        fit = row['fit_seconds']['default'] + row['fit_seconds']['income']
+        print(f"{row['engine']:>8} {fit:>7.2f} {row['single_row_ms']['sklearn']:>12.3f} "
+              f"{row['single_row_ms']['predict']:>11.3f} {row['batch_rows_per_second']:>13} "
+              f"{row['default_auc']:>8.4f} {row['default_accuracy']:>8.4f} "
+              f"{row['income_auc']:>8.4f} {row['income_accuracy']:>8.4f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': len(frame), 'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# Per-request cost of /predict body handling: generic coercion vs typed decoding
+# Usage (from ML_Models): python -m benchmarks.bench_request_decoding [--requests 2000] [--json decoding.json]
+#
+# Replays bodies sampled from beneficiary_dataset_preprocessed.csv through
+#   generic - json.loads + app.coerce_input_types, then predict on the dict
+#   typed   - request_decoding.loads + RequestDecoder.decode, then predict on the record
+# and reports the median microseconds of decoding, of predict and of both together.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import request_decoding
+from app import coerce_input_types, ml_model
+from request_decoding import RequestDecoder
+
+DATASET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'beneficiary_dataset_preprocessed.csv')
+
+
+def time_pass(fn, items):
+    """Mean microseconds of fn(item) over one pass through items"""
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def compare_paths(paths, repeat):
+    """Median per-request microseconds of each path; passes alternate so machine noise hits both alike"""
+    timings = {name: [] for name in paths}
+    for _ in range(repeat):
+        for name, (fn, items) in paths.items():
+            timings[name].append(time_pass(fn, items))
+    return {name: round(float(np.median(values)), 2) for name, values in timings.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Typed vs generic /predict body decoding')
+    parser.add_argument('--data', default=DATASET, help='CSV to sample request bodies from')
+    parser.add_argument('--requests', type=int, default=2000, help='bodies per timed pass')
+    parser.add_argument('--repeat', type=int, default=9, help='timed passes per path')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', default=None, help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    frame = pd.read_csv(args.data)
+    sample = frame[list(ml_model.feature_definitions)].sample(
+        n=args.requests, replace=args.requests > len(frame), random_state=args.seed)
+    bodies = [json.dumps(row).encode() for row in json.loads(sample.to_json(orient='records'))]
+
+    decoder = RequestDecoder(ml_model)
+    generic_decode = lambda body: coerce_input_types(json.loads(body))
+    typed_decode = lambda body: decoder.decode(request_decoding.loads(body))
+
+    generic_inputs = [generic_decode(body) for body in bodies]
+    typed_inputs = [typed_decode(body) for body in bodies]
+    if any(record is None for record in typed_inputs):
+        print("⚠️ Some bodies fell back to the generic path")
+    if [ml_model.predict(row) for row in generic_inputs] != [ml_model.predict(row) for row in typed_inputs]:
+        print("❌ Typed decoding changed a prediction")
+        return 1
+
+    steps = {
+        'decode_us': {'generic': (generic_decode, bodies), 'typed': (typed_decode, bodies)},
+        'predict_us': {'generic': (ml_model.predict, generic_inputs), 'typed': (ml_model.predict, typed_inputs)},
+        'end_to_end_us': {'generic': (lambda body: ml_model.predict(generic_decode(body)), bodies),
+                          'typed': (lambda body: ml_model.predict(typed_decode(body)), bodies)},
+    }
+    results = {'generic': {}, 'typed': {}}
+    for step, paths in steps.items():
+        for name, value in compare_paths(paths, args.repeat).items():
+            results[name][step] = value
+
+    print(f"\n📊 {args.requests} request bodies, JSON backend: "
+          f"{'orjson' if request_decoding.orjson is not None else 'json'}")
+    print(f"{'path':>8} {'decode us':>10} {'predict us':>11} {'total us':>9}")
+    for name, row in results.items():
+        print(f"{name:>8} {row['decode_us']:>10.2f} {row['predict_us']:>11.2f} {row['end_to_end_us']:>9.2f}")
+    saved = results['generic']['end_to_end_us'] - results['typed']['end_to_end_us']
+    print(f"⚡ Typed decoding saves {saved:.1f} us per request")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'requests': args.requests, 'orjson': request_decoding.orjson is not None,
+                       'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+# Load test and benchmark suite for the scoring service
+# Usage (from ML_Models):
+#   python -m benchmarks.bench_service [--targets direct client server] [--json run.json]
+#   python -m benchmarks.bench_service --json run.json --baseline baseline.json [--threshold 0.15]
+#
+# Replays payloads sampled from beneficiary_dataset_preprocessed.csv against
+#   direct  - InteractiveMLModel.predict in this process
+#   client  - the Flask /predict route through app.test_client()
+#   server  - a real local server (gunicorn, or werkzeug with --server werkzeug) over HTTP
+# and reports p50/p95/p99 latency (sequential requests), throughput at a fixed
+# concurrency, cold start (import app + first prediction in a fresh interpreter)
+# and peak RSS. With --baseline, every metric is compared to a stored run and the
+# script exits with status 1 when one regresses by more than --threshold.
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from memory_usage import peak_rss_bytes
+from model import InteractiveMLModel
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET = os.path.join(BASE_DIR, 'beneficiary_dataset_preprocessed.csv')
+TARGETS = ('direct', 'client', 'server')
+
+# Child process for the cold start measurement; prints one JSON line
+COLD_START_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import app
+loaded = time.perf_counter()
+from model import create_sample_input
+app.ml_model.predict(create_sample_input())
+done = time.perf_counter()
+from memory_usage import peak_rss_bytes
+print(json.dumps({'import_seconds': loaded - start, 'first_predict_seconds': done - loaded,
+                  'total_seconds': done - start, 'peak_rss_bytes': peak_rss_bytes()}))
+'''
+
+# Whether a larger value of a metric is better; everything else regresses upwards
+HIGHER_IS_BETTER = {'throughput_rps'}
+
+
+def load_payloads(path, n, seed):
+    """n request bodies sampled from the dataset's 20 input columns, as the web form would send them"""
+    frame = pd.read_csv(path)
+    columns = list(InteractiveMLModel().feature_definitions)
+    sample = frame[columns].sample(n=n, replace=n > len(frame), random_state=seed)
+    # Round-trip through JSON so values are plain Python types
+    return json.loads(sample.to_json(orient='records'))
+
+
+def percentiles(latencies):
+    """p50 / p95 / p99 / mean of a list of seconds, in milliseconds"""
+    ms = np.asarray(latencies) * 1e3
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+    }
+
+
+def measure(send, payloads, concurrency, warmup):
+    """Sequential latency percentiles, then throughput with `concurrency` threads replaying the payloads"""
+    for payload in payloads[:warmup]:
+        send(payload)
+
+    latencies = []
+    for payload in payloads:
+        start = time.perf_counter()
+        send(payload)
+        latencies.append(time.perf_counter() - start)
+
+    def replay(share):
+        for payload in share:
+            send(payload)
+
+    shares = [payloads[i::concurrency] for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(replay, shares))
+    elapsed = time.perf_counter() - start
+
+    result = percentiles(latencies)
+    result['throughput_rps'] = round(len(payloads) / elapsed, 1)
+    result['concurrency'] = concurrency
+    result['requests'] = len(payloads)
+    return result
+
+
+def bench_direct(payloads, concurrency, warmup):
+    import app
+    return measure(app.ml_model.predict, payloads, concurrency, warmup)
+
+
+def bench_client(payloads, concurrency, warmup):
+    import app
+    local = threading.local()
+
+    def send(payload):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.app.test_client()
+        response = client.post('/predict', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}")
+
+    return measure(send, payloads, concurrency, warmup)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port, concurrency):
+    """Launch the app on 127.0.0.1:port in a subprocess and wait until /health answers"""
+    env = dict(os.environ, ML_BIND=f'127.0.0.1:{port}', ML_WORKERS='1', ML_THREADS=str(concurrency))
+    if kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not come up on port {port}")
+
+
+def tree_peak_rss(pid):
+    """Largest peak RSS (VmHWM) among a process and its children, Linux only"""
+    def hwm(p):
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    peaks = [peak for peak in map(hwm, pids) if peak is not None]
+    return max(peaks) if peaks else None
+
+
+def bench_server(payloads, concurrency, warmup, kind):
+    port = free_port()
+    process = start_server(kind, port, concurrency)
+    local = threading.local()
+    connections = []
+    headers = {'Content-Type': 'application/json'}
+
+    def send(payload):
+        # Keep-alive per thread; reconnect when the server closed the connection
+        for attempt in range(2):
+            connection = getattr(local, 'connection', None)
+            if connection is None:
+                connection = local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                connections.append(connection)
+            try:
+                connection.request('POST', '/predict', body=json.dumps(payload), headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.will_close:
+                    connection.close()
+                    local.connection = None
+                break
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"/predict returned {response.status}")
+
+    try:
+        result = measure(send, payloads, concurrency, warmup)
+        result['server'] = kind
+        result['server_peak_rss_bytes'] = tree_peak_rss(process.pid)
+    finally:
+        for connection in connections:
+            connection.close()
+        # SIGINT is a quick shutdown for both servers (gunicorn's SIGTERM waits for idle keep-alives)
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=30)
+    return result
+
+
+def cold_start(runs):
+    """Median of `runs` fresh-interpreter cold starts"""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT], cwd=BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    result = {key: round(float(np.median([s[key] for s in samples])), 3)
+              for key in ('import_seconds', 'first_predict_seconds', 'total_seconds')}
+    peaks = [s['peak_rss_bytes'] for s in samples if s['peak_rss_bytes']]
+    result['peak_rss_bytes'] = max(peaks) if peaks else None
+    return result
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numeric leaves only"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(current, baseline, threshold):
+    """Metrics that are worse than the baseline by more than threshold (a fraction); returns report rows"""
+    regressions = []
+    now, before = flatten(current), flatten(baseline)
+    for key, old in before.items():
+        new = now.get(key)
+        metric = key.rsplit('.', 1)[-1]
+        if new is None or not old or metric in ('concurrency', 'requests'):
+            continue
+        change = (new - old) / old
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        if worse > threshold:
+            regressions.append({'metric': key, 'baseline': old, 'current': new, 'change': round(change, 4)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latency, throughput, cold start and memory benchmark')
+    parser.add_argument('--data', default=DATASET, help='CSV to sample request payloads from')
+    parser.add_argument('--targets', nargs='+', default=list(TARGETS), choices=TARGETS)
+    parser.add_argument('--requests', type=int, default=2000, help='payloads replayed per target')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads in the throughput run')
+    parser.add_argument('--warmup', type=int, default=50, help='untimed requests before measuring')
+    parser.add_argument('--server', default='gunicorn', choices=('gunicorn', 'werkzeug'))
+    parser.add_argument('--cold-start-runs', type=int, default=3, help='fresh interpreters to time (0 to skip)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', default=None, help='write results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='earlier --json output to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed relative regression per metric')
+    args = parser.parse_args(argv)
+
+    payloads = load_payloads(args.data, args.requests, args.seed)
+    results = {}
+    if args.cold_start_runs:
+        # Runs first so it is not affected by the page cache state of later targets' imports
+        results['cold_start'] = cold_start(args.cold_start_runs)
+    for target in args.targets:
+        if target == 'direct':
+            results['direct'] = bench_direct(payloads, args.concurrency, args.warmup)
+        elif target == 'client':
+            results['client'] = bench_client(payloads, args.concurrency, args.warmup)
+        else:
+            results['server'] = bench_server(payloads, args.concurrency, args.warmup, args.server)
+    results['benchmark_peak_rss_bytes'] = peak_rss_bytes()
+
+    print(f"\n📊 {args.requests} payloads per target, concurrency {args.concurrency}, {os.cpu_count()} CPU cores")
+    print(f"{'target':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9}")
+    for target in args.targets:
+        row = results[target]
+        print(f"{target:>8} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {row['p99_ms']:>8.3f} "
+              f"{row['throughput_rps']:>9.1f}")
+    if 'cold_start' in results:
+        cold = results['cold_start']
+        rss = cold['peak_rss_bytes'] / 2 ** 20 if cold['peak_rss_bytes'] else float('nan')
+        print(f"🧊 Cold start {cold['total_seconds']:.2f}s (import {cold['import_seconds']:.2f}s, "
+              f"first predict {cold['first_predict_seconds'] * 1e3:.1f} ms), peak RSS {rss:.0f} MiB")
+
+    report = {'cpu_count': os.cpu_count(), 'python': sys.version.split()[0], 'requests': args.requests,
+              'concurrency': args.concurrency, 'results': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed by more than {args.threshold:.0%}:")
+            for row in regressions:
+                print(f"   {row['metric']}: {row['baseline']} -> {row['current']} ({row['change']:+.1%})")
+            return 1
+        print(f"✅ No regression above {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# Service startup time against a budget
+# Usage (from ML_Models): python -m benchmarks.bench_startup [--runs 5] [--update-budget] [--json startup.json]
+#
+# Starts fresh interpreters with -X importtime that import app (loading the cached
+# artifacts and running the warm-up prediction) and score one sample row, then
+# reports the median time to ready and the packages that took longest to import.
+#
+# The budget is relative to the machine: startup_budget.json holds the allowed
+# ratio of time to ready over a reference start (a fresh interpreter importing
+# numpy and flask) measured alongside it, so a slower box gets a proportionally
+# larger budget. ML_STARTUP_BUDGET_SECONDS sets an absolute budget instead.
+# Exits 1 if the median exceeds the budget or a module kept off the serving path
+# (pandas, sklearn, scipy) was imported, so a stray top-level import fails the check.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+# Headroom over the measured ratio when the budget is rewritten; generous so
+# timing noise and differences between machines do not fail the check
+BUDGET_MARGIN = 2.0
+
+# Absolute budget in seconds for this machine, overriding the ratio
+BUDGET_SECONDS_ENV = 'ML_STARTUP_BUDGET_SECONDS'
+
+# Run in the child: time to a served prediction, and which heavy modules got loaded
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+from model import create_sample_input
+app.ml_model.predict(create_sample_input())
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+'''
+
+# Run in the child: the same machine's time to import the serving path's main dependencies
+REFERENCE_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import numpy, flask
+print(json.dumps({"seconds": time.perf_counter() - start}))
+'''
+
+
+def parse_importtime(stderr):
+    """Seconds spent importing each top-level package (its own modules' self times) in -X importtime output"""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        if not own.strip().isdigit():
+            continue
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(own) / 1e6
+    return packages
+
+
+def measure_startup():
+    """One cold start; returns (seconds to ready, loaded module names, import seconds per package)"""
+    env = dict(os.environ, ML_EAGER_ARTIFACTS='0')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT], cwd=SERVICE_DIR,
+                            env=env, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report['seconds'], set(report['modules']), parse_importtime(result.stderr)
+
+
+def measure_reference():
+    """One cold reference start (numpy and flask imports) under the same interpreter flags; returns seconds"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', REFERENCE_SCRIPT], cwd=SERVICE_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])['seconds']
+
+
+def load_budget(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Service startup time and serving-path imports against a budget')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to take the median of')
+    parser.add_argument('--top', type=int, default=10, help='slowest packages to list')
+    parser.add_argument('--budget', default=BUDGET_FILE, help='budget JSON file')
+    parser.add_argument('--update-budget', action='store_true',
+                        help=f'rewrite the budget ratio as the measured one x {BUDGET_MARGIN}')
+    parser.add_argument('--json', default=None, help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    budget = load_budget(args.budget)
+
+    # The first start may train and cache the artifacts; it is not timed
+    measure_startup()
+    seconds, references, modules, imports = [], [], set(), {}
+    for _ in range(args.runs):
+        # Interleaved so both see the same load on the machine
+        references.append(measure_reference())
+        elapsed, loaded, timings = measure_startup()
+        seconds.append(elapsed)
+        modules |= loaded
+        for name, value in timings.items():
+            imports.setdefault(name, []).append(value)
+
+    median = float(np.median(seconds))
+    reference = float(np.median(references))
+    ratio = median / reference
+    override = os.environ.get(BUDGET_SECONDS_ENV)
+    if override:
+        limit, source = float(override), BUDGET_SECONDS_ENV
+    else:
+        limit, source = budget['startup_ratio'] * reference, f"{budget['startup_ratio']:.2f} x reference"
+    heaviest = sorted(((float(np.median(values)), name) for name, values in imports.items()), reverse=True)
+    forbidden = sorted(name for name in budget['forbidden_modules'] if name in modules)
+
+    print(f"\n🚀 Startup to first prediction: median {median * 1e3:.0f} ms over {args.runs} runs "
+          f"(budget {limit * 1e3:.0f} ms = {source})")
+    print(f"📏 Reference start (numpy + flask): median {reference * 1e3:.0f} ms; ratio {ratio:.2f}")
+    print(f"{'package':>28} {'import ms':>10}")
+    for value, name in heaviest[:args.top]:
+        print(f"{name:>28} {value * 1e3:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'runs': [round(value, 4) for value in seconds], 'median_seconds': round(median, 4),
+                       'reference_seconds': round(reference, 4), 'ratio': round(ratio, 3),
+                       'budget': budget, 'budget_seconds': round(limit, 4), 'forbidden_loaded': forbidden,
+                       'imports_ms': {name: round(value * 1e3, 2) for value, name in heaviest}}, f, indent=2)
+
+    if args.update_budget:
+        budget['startup_ratio'] = round(ratio * BUDGET_MARGIN, 2)
+        with open(args.budget, 'w') as f:
+            json.dump(budget, f, indent=2)
+            f.write('\n')
+        print(f"💾 Budget set to {budget['startup_ratio']:.2f} x reference in {args.budget}")
+
+    failed = False
+    if forbidden:
+        print(f"❌ Imported on the serving path: {', '.join(forbidden)}")
+        failed = True
+    if median > limit and not args.update_budget:
+        print(f"❌ Startup over budget by {(median - limit) * 1e3:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
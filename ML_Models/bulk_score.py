@@ -0,0 +1,178 @@
+# Offline bulk scoring for whole beneficiary portfolios
+# Usage: python -m bulk_score beneficiary_dataset_preprocessed.csv [-o bulk_scores.csv] [-j 0]
+#
+# Streams a CSV file (or the columnar cache of an XLSX workbook) in chunks, scores
+# each chunk with one vectorized pass and appends the results in the
+# composite_credit_scores.csv format, so memory stays flat regardless of the file size. With -j, chunks are fanned out to a
+# process pool whose workers load the model artifacts once at start-up.
+# The scores are then saved as the portfolio percentile index of the models that
+# produced them (see score_index), which the service picks up on its next model
+# reload; --no-index skips that. Credit categories use the bands of the served
+# models' index when there is one.
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model import InteractiveMLModel
+from artifacts import DEFAULT_ARTIFACT_DIR
+from datasets import load_dataset
+from score_index import CREDIT_CATEGORIES, CREDIT_CATEGORY_EDGES, ScoreIndex, model_identity
+
+DEFAULT_CHUNKSIZE = 50000
+
+OUTPUT_COLUMNS = ['default_risk_proba', 'income_score_norm', 'composite_score', 'credit_category']
+
+
+# Default output; composite_credit_scores.csv is the tracked reference population
+DEFAULT_OUTPUT = 'bulk_scores.csv'
+
+
+def input_dtypes(model):
+    """Pinned dtypes for the categorical input features (avoids per-chunk type inference)"""
+    # Numeric columns are left to inference: a pinned float64 would abort the run on
+    # one malformed cell, while an inferred object column just fails validation per row
+    return {
+        feature: 'category'
+        for feature, definition in model.feature_definitions.items() if definition['type'] == 'categorical'
+    }
+
+
+def credit_categories(composite_scores, edges=CREDIT_CATEGORY_EDGES):
+    """Map composite scores to the portfolio credit categories"""
+    codes = np.searchsorted(edges, composite_scores, side='left')
+    return np.asarray(CREDIT_CATEGORIES, dtype=object)[codes]
+
+
+def iter_chunks(path, model, chunksize, id_column=None):
+    """Yield DataFrame chunks holding only the columns needed for scoring"""
+    columns = list(model.feature_definitions) + ([id_column] if id_column else [])
+
+    # Workbooks are parsed once into the columnar cache, then read column by column
+    if path.lower().endswith(('.xlsx', '.xlsm', '.xls')):
+        dataset = load_dataset(path)
+        yield from dataset.iter_chunks([column for column in columns if column in dataset], chunksize)
+        return
+
+    dtypes = input_dtypes(model)
+    if id_column:
+        dtypes[id_column] = str
+    yield from pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+def score_chunk(model, chunk, id_column=None, edges=CREDIT_CATEGORY_EDGES):
+    """Score one chunk; returns (output rows, number of invalid rows)"""
+    scores, error_mask = model.score_frame(chunk)
+    scores['credit_category'] = credit_categories(scores['composite_score'].to_numpy(), edges)
+    if id_column:
+        scores.index = chunk.loc[scores.index, id_column]
+        scores.index.name = None
+    return scores[OUTPUT_COLUMNS], int(error_mask.sum())
+
+
+# Model loaded once per pool worker by _init_worker
+_worker_model = None
+
+
+def _init_worker(artifact_dir):
+    """Pool initializer: load the cached artifacts once per worker process"""
+    global _worker_model
+    _worker_model = InteractiveMLModel()
+    _worker_model.load_or_train_models(artifact_dir)
+
+
+def _score_in_worker(chunk, id_column, edges):
+    return score_chunk(_worker_model, chunk, id_column, edges)
+
+
+def iter_scored_chunks(chunks, model, workers, artifact_dir, id_column=None, edges=CREDIT_CATEGORY_EDGES):
+    """Score chunks in-process or across a process pool, yielding results in input order"""
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(model, chunk, id_column, edges)
+        return
+
+    # Keep a bounded number of chunks in flight so memory stays flat
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(artifact_dir,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_score_in_worker, chunk, id_column, edges))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def bulk_score(input_path, output_path, chunksize=DEFAULT_CHUNKSIZE, id_column=None,
+               artifact_dir=DEFAULT_ARTIFACT_DIR, model=None, workers=1, index_dir=None):
+    """Score every row of input_path into output_path; returns (rows scored, rows skipped)
+
+    With index_dir, the composite scores are also saved there as the portfolio percentile index.
+    """
+    if model is None:
+        # Also makes sure the artifact bundle exists before any pool worker loads it
+        model = InteractiveMLModel()
+        model.load_or_train_models(artifact_dir)
+
+    # Bands of the served models' portfolio, so categories agree with the service's credit_band
+    served = ScoreIndex.load(artifact_dir, model_identity(model)) if model.artifact_generation else None
+    edges = served.edges if served is not None else CREDIT_CATEGORY_EDGES
+
+    scored = skipped = 0
+    composite_scores = []
+    tmp_path = f'{output_path}.tmp-{os.getpid()}'
+    start = time.perf_counter()
+
+    with open(tmp_path, 'w', newline='') as out:
+        header = True
+        chunks = iter_chunks(input_path, model, chunksize, id_column)
+        for scores, invalid in iter_scored_chunks(chunks, model, workers, artifact_dir, id_column, edges):
+            scores.to_csv(out, header=header)
+            header = False
+            if index_dir is not None:
+                composite_scores.append(scores['composite_score'].to_numpy())
+
+            scored += len(scores)
+            skipped += invalid
+            print(f"📦 Scored {scored} rows ({skipped} invalid skipped) "
+                  f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    os.replace(tmp_path, output_path)
+
+    if index_dir is not None and scored:
+        index = ScoreIndex.from_scores(np.concatenate(composite_scores), edges, source=os.path.abspath(output_path),
+                                       models=model_identity(model))
+        print(f"📈 Score index of {scored} scores saved to {index.save(index_dir)}", file=sys.stderr)
+    return scored, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk-score a beneficiary CSV/XLSX file')
+    parser.add_argument('input', help='beneficiary CSV or XLSX file with the 20 model features')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT,
+                        help=f'output CSV in the composite_credit_scores.csv format (default: {DEFAULT_OUTPUT})')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='rows per chunk')
+    parser.add_argument('--id-column', default=None,
+                        help='input column to use as the output index (default: row number)')
+    parser.add_argument('--artifact-dir', default=DEFAULT_ARTIFACT_DIR, help='model artifact cache directory')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='scoring processes (0 = one per CPU core)')
+    parser.add_argument('--no-index', action='store_true',
+                        help='do not refresh the portfolio percentile index in the artifact directory')
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count()
+    scored, skipped = bulk_score(args.input, args.output, args.chunksize, args.id_column, args.artifact_dir,
+                                 workers=workers, index_dir=None if args.no_index else args.artifact_dir)
+    print(f"✅ Wrote {scored} scores to {args.output}" + (f" ({skipped} invalid rows skipped)" if skipped else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+# Model compaction for the serving tree ensembles
+# Usage (from ML_Models): python -m compaction [--level 0 1 2 3] [--trees 0.5] [--min-gain 1e-3]
+#                             [--values int16] [--thresholds float32] [--json compaction.json]
+#
+# Shrinks the compiled forms of the served models and writes each result as an
+# artifact bundle under compact_models/level-<n> (serve it with
+# ML_ARTIFACT_DIR=compact_models/level-<n>, or POST it to /admin/reload as
+# cache_dir). Compaction works in three steps:
+#   trees       keep the trees that move the score most (cover-weighted variance
+#               of their leaf values); boosting folds the expected value of the
+#               dropped trees into its init score
+#   min-gain    collapse splits whose children are leaves and whose gain is
+#               below this fraction of their tree's total variance
+#   thresholds  float32 thresholds, rounded down (exact for float32 inputs)
+#   / values    leaf values as float32 or int16 / int8 codes with one scale
+# Node indices and features are stored in the narrowest integer types at every
+# level. Compacted bundles hold only the compiled ensembles, not the sklearn
+# models, so they cannot be updated incrementally, and every batch is scored by
+# the array engine: batches above COMPILED_MAX_ROWS lose sklearn's C loops and
+# can be several times slower than with the original bundle.
+#
+# Every level is scored against the original on beneficiary_dataset_preprocessed.csv
+# (bundle size, load time, single-row latency, latency of the whole file as one
+# batch and its slowdown over the original, ROC AUC) so the level can be picked
+# from measured tradeoffs.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+from artifacts import DEFAULT_ARTIFACT_DIR, bundle_path, read_bundle, resolve
+from model import InteractiveMLModel, INCOME_BANDS, COMPILED_MAX_ROWS
+from tree_engine import CompiledTreeEnsemble, compile_ensemble
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA = os.path.join(BASE_DIR, 'beneficiary_dataset_preprocessed.csv')
+DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, 'compact_models')
+
+# Presets, from identical predictions (0) to the smallest artifact (3)
+COMPACTION_LEVELS = {
+    0: {'trees': 1.0, 'min_gain': 0.0, 'thresholds': 'auto', 'values': 'float64'},
+    1: {'trees': 1.0, 'min_gain': 1e-4, 'thresholds': 'auto', 'values': 'float32'},
+    2: {'trees': 0.75, 'min_gain': 1e-3, 'thresholds': 'float32', 'values': 'int16'},
+    3: {'trees': 0.5, 'min_gain': 1e-2, 'thresholds': 'float32', 'values': 'int8'},
+}
+
+VALUE_DTYPES = {'float64': np.float64, 'float32': np.float32, 'int16': np.int16, 'int8': np.int8}
+THRESHOLD_CHOICES = ('auto', 'float64', 'float32')
+
+
+def _ensemble_like(ensemble, children, feature, threshold, value, roots, cover, init_raw=None, value_scale=None):
+    """New ensemble with the given node arrays and the settings of ensemble"""
+    max_depth = max(int(_depths(children, roots, ensemble.max_depth).max()), 1)
+    return CompiledTreeEnsemble(children, feature, threshold, value, roots, max_depth, ensemble.classes_,
+                                link=ensemble.link,
+                                init_raw=ensemble.init_raw if init_raw is None else init_raw,
+                                input_dtype=ensemble.input_dtype, cover=cover, value_scale=value_scale)
+
+
+def _depths(children, roots, max_depth):
+    return CompiledTreeEnsemble(children, None, None, None, roots, max_depth, None).node_depths()
+
+
+def _rebuild(ensemble, children, feature, threshold, value, roots, cover, init_raw=None):
+    """Ensemble of the nodes reachable from roots, renumbered in order (trees stay contiguous)"""
+    reachable = _depths(children, roots, ensemble.max_depth) >= 0
+    new_id = np.cumsum(reachable) - 1
+    kept = np.flatnonzero(reachable)
+    children = new_id[children.reshape(-1, 2)[kept]].ravel()
+    return _ensemble_like(ensemble, children, feature[kept], threshold[kept], value[kept],
+                          new_id[roots], cover[kept], init_raw)
+
+
+def _tree_of_node(ensemble):
+    return np.repeat(np.arange(ensemble.n_trees), np.diff(np.append(ensemble.roots, ensemble.n_nodes)))
+
+
+def tree_variance(ensemble):
+    """Cover-weighted variance of every tree's leaf values around its expected value"""
+    expectations = ensemble.node_expectations()
+    cover = ensemble.cover.astype(np.float64)
+    nodes = np.arange(ensemble.n_nodes)
+    leaves = (ensemble.children[0::2] == nodes) & (ensemble.node_depths() >= 0)
+    tree_of = _tree_of_node(ensemble)
+
+    deviation = expectations[leaves] - expectations[ensemble.roots][tree_of[leaves]]
+    spread = np.bincount(tree_of[leaves], weights=cover[leaves] * (deviation ** 2).sum(axis=1),
+                         minlength=ensemble.n_trees)
+    return spread / np.maximum(cover[ensemble.roots], 1e-12)
+
+
+def select_trees(ensemble, fraction):
+    """Keep the given fraction of trees, those with the largest variance"""
+    n_keep = max(1, int(round(fraction * ensemble.n_trees)))
+    if n_keep >= ensemble.n_trees:
+        return ensemble
+
+    order = np.argsort(-tree_variance(ensemble), kind='stable')
+    kept = np.sort(order[:n_keep])
+    dropped = np.sort(order[n_keep:])
+
+    init_raw = None
+    if ensemble.link != 'mean':
+        # Boosted trees add up: a dropped tree is replaced by its expected value
+        expectations = ensemble.node_expectations()
+        init_raw = ensemble.init_raw + expectations[ensemble.roots[dropped]].sum(axis=0)
+    return _rebuild(ensemble, ensemble.children, ensemble.feature, ensemble.threshold,
+                    ensemble.leaf_values(), ensemble.roots[kept], ensemble.cover, init_raw)
+
+
+def prune_leaves(ensemble, min_gain):
+    """Collapse low-gain splits into leaves holding their expected value, bottom-up"""
+    if min_gain <= 0:
+        return ensemble
+
+    expectations = ensemble.node_expectations()
+    cover = ensemble.cover.astype(np.float64)
+    children = ensemble.children.copy()
+    threshold = ensemble.threshold.copy()
+    feature = ensemble.feature.copy()
+    value = ensemble.leaf_values()
+
+    nodes = np.arange(ensemble.n_nodes)
+    left, right = children[0::2], children[1::2]
+    internal = left != nodes
+    depth = ensemble.node_depths()
+    tree_of = _tree_of_node(ensemble)
+    root_cover = np.maximum(cover[ensemble.roots], 1e-12)
+    limit = min_gain * tree_variance(ensemble)
+
+    for level in range(ensemble.max_depth - 1, -1, -1):
+        # Only splits whose children are both leaves (possibly just collapsed) can go
+        candidates = nodes[internal & (depth == level)]
+        candidates = candidates[~internal[left[candidates]] & ~internal[right[candidates]]]
+        l, r = left[candidates], right[candidates]
+        parent = expectations[candidates]
+        gain = (cover[l] * ((expectations[l] - parent) ** 2).sum(axis=1)
+                + cover[r] * ((expectations[r] - parent) ** 2).sum(axis=1)) / root_cover[tree_of[candidates]]
+        collapse = candidates[gain < limit[tree_of[candidates]]]
+
+        # left / right are views of children, so this turns the nodes into leaves
+        internal[collapse] = False
+        left[collapse] = collapse
+        right[collapse] = collapse
+        feature[collapse] = 0
+        threshold[collapse] = np.inf
+        value[collapse] = expectations[collapse]
+
+    return _rebuild(ensemble, children, feature, threshold, value, ensemble.roots, ensemble.cover)
+
+
+def _round_down_float32(threshold):
+    """float32 thresholds no larger than the originals: x > t keeps its result for every float32 x"""
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def narrow_arrays(ensemble, thresholds='auto', values='float64'):
+    """Store node arrays in the narrowest dtypes; values may become integer codes with one scale"""
+    n_nodes = ensemble.n_nodes
+    index_dtype = np.int32 if 2 * n_nodes < np.iinfo(np.int32).max else np.intp
+    feature_dtype = np.min_scalar_type(int(ensemble.feature.max()))
+
+    if thresholds == 'auto':
+        thresholds = 'float32' if ensemble.input_dtype == np.float32 else 'float64'
+    threshold = (_round_down_float32(ensemble.threshold) if thresholds == 'float32'
+                 else ensemble.threshold.astype(np.float64))
+
+    value = ensemble.leaf_values()
+    value_scale = None
+    dtype = VALUE_DTYPES[values]
+    if np.issubdtype(dtype, np.integer):
+        # Symmetric codes keep zero exact (boosted trees fill only their own class column)
+        largest = float(np.abs(value).max())
+        value_scale = largest / np.iinfo(dtype).max if largest > 0 else 1.0
+        value = np.rint(value / value_scale).astype(dtype)
+    else:
+        value = value.astype(dtype)
+
+    return _ensemble_like(ensemble, ensemble.children.astype(index_dtype), ensemble.feature.astype(feature_dtype),
+                          threshold, value, ensemble.roots.astype(index_dtype),
+                          ensemble.cover.astype(np.float32), value_scale=value_scale)
+
+
+def compact_ensemble(ensemble, trees=1.0, min_gain=0.0, thresholds='auto', values='float64'):
+    """Compacted copy of a compiled ensemble (see module header)"""
+    ensemble = select_trees(ensemble, trees)
+    ensemble = prune_leaves(ensemble, min_gain)
+    return narrow_arrays(ensemble, thresholds, values)
+
+
+def compact_model_set(models, **settings):
+    """ModelSet whose tree models are replaced by compacted compiled ensembles"""
+    compacted = {}
+    for name in ('default_model', 'income_model'):
+        model = resolve(getattr(models, name))
+        compiled = model if isinstance(model, CompiledTreeEnsemble) else compile_ensemble(model)
+        if compiled is None or compiled.cover is None:
+            print(f"⚠️ {type(model).__name__} is not a tree ensemble, {name} is kept as it is")
+            compacted[name] = (model, getattr(models, 'fast_' + name))
+        else:
+            # The compacted ensemble serves every batch size, so the sklearn model is dropped
+            compacted[name] = (compact_ensemble(compiled, **settings), None)
+    return models._replace(default_model=compacted['default_model'][0], fast_default_model=compacted['default_model'][1],
+                           income_model=compacted['income_model'][0], fast_income_model=compacted['income_model'][1])
+
+
+def ensemble_stats(model):
+    """Tree and node counts and node array bytes of a compiled ensemble (None for other models)"""
+    if not isinstance(model, CompiledTreeEnsemble):
+        return None
+    arrays = (model.children, model.feature, model.threshold, model.value, model.roots, model.cover)
+    return {'trees': model.n_trees, 'nodes': model.n_nodes, 'max_depth': model.max_depth,
+            'array_bytes': int(sum(array.nbytes for array in arrays if array is not None))}
+
+
+def write_model_set(model, models, directory):
+    """Save a ModelSet as the bundle of model's schema in directory, replacing an older one"""
+    live = model.models
+    model.models = models
+    try:
+        return model.save_artifact_bundle(directory, replace=True)
+    finally:
+        model.models = live
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def median_seconds(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def load_eval_data(model, path):
+    """Valid rows of the evaluation CSV with default and income band labels"""
+    frame = pd.read_csv(path)
+    frame = frame[~model.validate_frame(frame)].reset_index(drop=True)
+    y_default = frame['default_flag'].to_numpy().astype(int)
+    y_income = frame['income_band'].map(INCOME_BANDS.index).to_numpy().astype(int)
+    return frame, y_default, y_income
+
+
+def evaluate_bundle(engine, directory, frame, y_default, y_income, repeat):
+    """Measure the bundle in directory as the service would load and use it"""
+    serving = InteractiveMLModel(engine)
+    key = serving.artifact_key()
+    load_seconds = median_seconds(lambda: read_bundle(directory, key), repeat)
+    if not serving.load_artifact_bundle(directory):
+        raise RuntimeError(f"No loadable bundle in {directory}")
+
+    X = serving.build_feature_matrix(frame)
+    default_probs, _, income_probs = serving._score_matrix(X)
+    row = frame.loc[0, list(serving.feature_definitions)].to_dict()
+    models = serving.models
+    return {
+        'bundle_bytes': directory_bytes(os.path.realpath(bundle_path(directory, key))),
+        'load_ms': round(load_seconds * 1e3, 2),
+        'single_row_us': round(median_seconds(lambda: serving.predict(row), 50 * repeat) * 1e6, 1),
+        'batch_ms': round(median_seconds(lambda: serving.score_frame(frame), repeat) * 1e3, 2),
+        'default_auc': float(roc_auc_score(y_default, default_probs)),
+        'income_auc': float(roc_auc_score(y_income, income_probs, multi_class='ovr')),
+        'default_model': ensemble_stats(models.default_model) or ensemble_stats(models.fast_default_model),
+        'income_model': ensemble_stats(models.income_model) or ensemble_stats(models.fast_income_model),
+    }, default_probs, income_probs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compact the served tree ensembles and report the tradeoffs')
+    parser.add_argument('--level', type=int, action='append', choices=sorted(COMPACTION_LEVELS),
+                        help='compaction preset to build (repeatable; default: all)')
+    parser.add_argument('--trees', type=float, help='fraction of trees to keep')
+    parser.add_argument('--min-gain', type=float, help='prune splits below this fraction of tree variance')
+    parser.add_argument('--thresholds', choices=THRESHOLD_CHOICES, help='threshold precision')
+    parser.add_argument('--values', choices=sorted(VALUE_DTYPES), help='leaf value storage')
+    parser.add_argument('--source-dir', default=DEFAULT_ARTIFACT_DIR, help='artifact cache holding the models')
+    parser.add_argument('--default-model', help='pickled default risk model to compact instead (e.g. tuned_random_forest.pkl)')
+    parser.add_argument('--income-model', help='pickled income band model to compact instead')
+    parser.add_argument('--scaler', help='pickled scaler of the pickled models')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help='where the compacted bundles are written')
+    parser.add_argument('--data', default=DEFAULT_DATA, help='labelled CSV the levels are evaluated on')
+    parser.add_argument('--repeat', type=int, default=5, help='timed repetitions per measurement')
+    parser.add_argument('--json', default=None, help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    overrides = {key: value for key, value in (('trees', args.trees), ('min_gain', args.min_gain),
+                                               ('thresholds', args.thresholds), ('values', args.values))
+                 if value is not None}
+    levels = args.level or sorted(COMPACTION_LEVELS)
+
+    model = InteractiveMLModel()
+    model.load_or_train_models(args.source_dir)
+    if args.default_model or args.income_model or args.scaler:
+        model.models = model.load_model_set(default_model_path=args.default_model,
+                                            income_model_path=args.income_model, scaler_path=args.scaler)
+    frame, y_default, y_income = load_eval_data(model, args.data)
+
+    # The original set is saved and measured the same way as the compacted ones
+    with tempfile.TemporaryDirectory() as original_dir:
+        write_model_set(model, model.models, original_dir)
+        original, original_default, original_income = evaluate_bundle(
+            model.engine, original_dir, frame, y_default, y_income, args.repeat)
+    report = {'engine': model.engine, 'rows': len(frame), 'original': original, 'levels': []}
+
+    for level in levels:
+        settings = dict(COMPACTION_LEVELS[level], **overrides)
+        name = f'level-{level}' + ('-custom' if overrides else '')
+        directory = os.path.join(args.output_dir, name)
+        write_model_set(model, compact_model_set(model.models, **settings), directory)
+        result, default_probs, income_probs = evaluate_bundle(
+            model.engine, directory, frame, y_default, y_income, args.repeat)
+        result.update(
+            name=name, directory=directory, settings=settings,
+            batch_slowdown=result['batch_ms'] / original['batch_ms'],
+            default_auc_delta=result['default_auc'] - original['default_auc'],
+            income_auc_delta=result['income_auc'] - original['income_auc'],
+            max_default_change=float(np.max(np.abs(default_probs - original_default))),
+            income_band_agreement=float(np.mean(np.argmax(income_probs, axis=1) == np.argmax(original_income, axis=1))))
+        report['levels'].append(result)
+
+    print(f"\n📊 Compaction of the {model.engine} models on {len(frame)} rows of {os.path.basename(args.data)}")
+    batch_label = f'{len(frame)}-row ms'
+    print(f"{'bundle':>16} {'size MB':>8} {'load ms':>8} {'row us':>7} {batch_label:>13} {'vs orig':>7} "
+          f"{'default AUC':>16} {'income AUC':>16} {'max dP':>7} {'bands':>7}")
+    for result in [dict(original, name='original')] + report['levels']:
+        print(f"{result['name']:>16} {result['bundle_bytes'] / 1e6:>8.2f} {result['load_ms']:>8.2f} "
+              f"{result['single_row_us']:>7.0f} {result['batch_ms']:>13.2f} {result.get('batch_slowdown', 1.0):>6.1f}x "
+              f"{result['default_auc']:>8.4f} {result.get('default_auc_delta', 0.0):+.4f} "
+              f"{result['income_auc']:>8.4f} {result.get('income_auc_delta', 0.0):+.4f} "
+              f"{result.get('max_default_change', 0.0):>7.4f} {result.get('income_band_agreement', 1.0):>7.1%}")
+    slower = [result['name'] for result in report['levels'] if result['batch_slowdown'] > 1.1]
+    if slower:
+        print(f"⚠️ Batches over {COMPILED_MAX_ROWS} rows are slower with {', '.join(slower)}: compacted bundles "
+              f"score them with the array engine instead of sklearn")
+    print(f"💡 Serve a level with ML_ARTIFACT_DIR={os.path.join(args.output_dir, '<level>')}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# Columnar cache for the training / scoring datasets
+# XLSX (or CSV) sources are parsed once into per-column .npy files; later loads
+# memory-map only the columns that are actually used, so tune_models and bulk
+# scoring start in milliseconds instead of re-parsing the workbook with openpyxl.
+# The conversion itself streams the source in row chunks (openpyxl's read-only
+# mode for workbooks), so memory stays flat however many rows the file has.
+#
+# Usage:
+#   from datasets import load_dataset
+#   data = load_dataset('indian_microfinance_dataset_20k.xlsx')
+#   X = data.to_frame(['household_size', 'region'])
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default location of converted datasets (override with ML_DATASET_CACHE_DIR)
+DEFAULT_DATASET_CACHE_DIR = os.environ.get('ML_DATASET_CACHE_DIR', os.path.join(BASE_DIR, 'dataset_cache'))
+
+# Bump when the on-disk layout changes
+CACHE_VERSION = 2
+
+META_FILE = 'meta.json'
+
+# Rows parsed per step while converting a source
+CONVERT_CHUNKSIZE = 50000
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_xlsx_chunks(path, chunksize=CONVERT_CHUNKSIZE):
+    """Stream the rows of the first worksheet of a workbook as DataFrame chunks"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise SystemExit("❌ Reading XLSX files requires openpyxl (pip install openpyxl)")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(name) for name in next(rows)]
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_source_chunks(path, chunksize=CONVERT_CHUNKSIZE):
+    """Parse a source file as DataFrame chunks (the slow step the cache avoids)"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        yield from iter_xlsx_chunks(path, chunksize)
+    elif path.lower().endswith('.xls'):
+        # Legacy workbooks have no streaming reader; they are parsed whole
+        yield pd.read_excel(path)
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def _is_text(series):
+    return series.dtype == object or isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype))
+
+
+class ColumnarDataset:
+    """Lazily loaded columnar dataset; each column is memory-mapped on first access"""
+
+    def __init__(self, cache_path, meta):
+        self.cache_path = cache_path
+        self.meta = meta
+        self.columns = [column['name'] for column in meta['columns']]
+        self._specs = {column['name']: column for column in meta['columns']}
+        self._loaded = {}
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __contains__(self, column):
+        return column in self._specs
+
+    def __getitem__(self, column):
+        """Column as a NumPy array (codes -> labels for categorical columns)"""
+        if column not in self._loaded:
+            spec = self._specs[column]
+            data = np.load(os.path.join(self.cache_path, spec['file']), mmap_mode='r')
+            if spec['kind'] == 'categorical':
+                data = pd.Categorical.from_codes(data, categories=spec['categories'])
+            self._loaded[column] = data
+        return self._loaded[column]
+
+    def codes(self, column):
+        """Integer codes of a categorical column (-1 for missing) and its categories"""
+        spec = self._specs[column]
+        return np.load(os.path.join(self.cache_path, spec['file']), mmap_mode='r'), spec['categories']
+
+    def to_frame(self, columns=None, start=0, stop=None):
+        """DataFrame of the requested columns (all by default) for rows [start, stop)"""
+        columns = self.columns if columns is None else columns
+        stop = len(self) if stop is None else min(stop, len(self))
+        return pd.DataFrame({column: self[column][start:stop] for column in columns},
+                            index=pd.RangeIndex(start, stop))
+
+    def iter_chunks(self, columns=None, chunksize=50000):
+        """Yield DataFrame chunks of the requested columns"""
+        for start in range(0, len(self), chunksize):
+            yield self.to_frame(columns, start, start + chunksize)
+
+
+def cache_path_for(source_path, cache_dir=DEFAULT_DATASET_CACHE_DIR):
+    """Cache directory of a source file"""
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    path_hash = hashlib.sha256(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cache_dir, f'{name}-{path_hash}')
+
+
+def _read_meta(cache_path):
+    try:
+        with open(os.path.join(cache_path, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_is_fresh(meta, source_path):
+    """Cheap mtime/size check first; a changed mtime falls back to the content hash"""
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+    stat = os.stat(source_path)
+    if meta['source_size'] != stat.st_size:
+        return False
+    if meta['source_mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if meta['source_sha256'] != file_digest(source_path):
+        return False
+
+    # Same contents, new mtime (e.g. fresh checkout): remember it to skip hashing next time
+    meta['source_mtime_ns'] = stat.st_mtime_ns
+    return True
+
+
+def _write_column(parts, rows, path, spec):
+    """Join the (file, dtype) parts of one column into its .npy file of rows values, one part in memory at a time"""
+    dtypes = [dtype for _, dtype in parts]
+    parts = [part for part, _ in parts]
+
+    if object not in dtypes:
+        dtype = np.result_type(*dtypes)
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(rows,))
+        start = 0
+        for part in parts:
+            values = np.load(part, mmap_mode='r')
+            out[start:start + len(values)] = values
+            start += len(values)
+        out.flush()
+        spec.update(kind='numeric', dtype=str(dtype))
+        return
+
+    # Strings are stored as compact integer codes plus the category labels; a
+    # column with text in any chunk is text throughout
+    as_text = lambda part: pd.Series(np.load(part, allow_pickle=True)).astype('string').astype(object)
+    labels = set()
+    for part in parts:
+        values = as_text(part)
+        labels.update(values[values.notna()].unique())
+    categories = sorted(labels)
+
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.int32 if len(categories) > 32767 else np.int16,
+                                    shape=(rows,))
+    start = 0
+    for part in parts:
+        codes = pd.Categorical(as_text(part), categories=categories).codes
+        out[start:start + len(codes)] = codes
+        start += len(codes)
+    out.flush()
+    spec.update(kind='categorical', categories=[str(c) for c in categories])
+
+
+def convert(source_path, cache_path, chunksize=CONVERT_CHUNKSIZE):
+    """Parse a source file once, chunk by chunk, and write one .npy file per column"""
+    stat = os.stat(source_path)
+
+    tmp_path = f'{cache_path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    parts_path = os.path.join(tmp_path, 'parts')
+    os.makedirs(parts_path)
+
+    # Each chunk's columns are spilled to disk; the column files are assembled afterwards
+    names, parts, rows = None, None, 0
+    for i, chunk in enumerate(iter_source_chunks(source_path, chunksize)):
+        if names is None:
+            names = [str(name) for name in chunk.columns]
+            parts = [[] for _ in names]
+        for j, name in enumerate(chunk.columns):
+            series = chunk[name]
+            values = series.astype(object).to_numpy() if _is_text(series) else series.to_numpy()
+            part = os.path.join(parts_path, f'col{j:03d}-{i:06d}.npy')
+            np.save(part, values, allow_pickle=True)
+            parts[j].append((part, values.dtype))
+        rows += len(chunk)
+
+    columns = []
+    for j, name in enumerate(names or []):
+        spec = {'name': name, 'file': f'col{j:03d}.npy'}
+        _write_column(parts[j], rows, os.path.join(tmp_path, spec['file']), spec)
+        columns.append(spec)
+    shutil.rmtree(parts_path)
+
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(source_path),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_sha256': file_digest(source_path),
+        'rows': rows,
+        'columns': columns,
+    }
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.rename(tmp_path, cache_path)
+    return meta
+
+
+def load_dataset(source_path, cache_dir=DEFAULT_DATASET_CACHE_DIR):
+    """Columnar view of a dataset, converting (or refreshing) the cache when needed"""
+    cache_path = cache_path_for(source_path, cache_dir)
+    meta = _read_meta(cache_path)
+
+    mtime_ns = meta and meta.get('source_mtime_ns')
+    if not _cache_is_fresh(meta, source_path):
+        print(f"🔄 Converting {os.path.basename(source_path)} to columnar cache...")
+        os.makedirs(cache_dir, exist_ok=True)
+        meta = convert(source_path, cache_path)
+    elif meta['source_mtime_ns'] != mtime_ns:
+        with open(os.path.join(cache_path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    return ColumnarDataset(cache_path, meta)
@@ -0,0 +1,328 @@
+# Online feature drift monitoring for live prediction traffic
+# Every scored row's 20 input features are binned against a baseline taken from
+# the training data (deciles for numeric features, one bin per category) and
+# counted into a ring of time slots that covers a sliding window. As in
+# metrics.py the counts live in per-thread shards, so recording a batch is one
+# vectorized binning and one bincount with no lock, and memory is fixed at
+# slots x features x bins counters per thread. When /drift or /metrics is read
+# (at most once per refresh interval) the window is merged and compared with the
+# baseline: PSI for every feature, binned KS for the numeric ones.
+# Monitors are per process: with several gunicorn workers each one sees its own traffic.
+#
+# Usage (from ML_Models): python -m drift [beneficiary_dataset_preprocessed.csv] [--baseline-dir DIR]
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from artifacts import DEFAULT_ARTIFACT_DIR
+
+DEFAULT_TRAINING_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'beneficiary_dataset_preprocessed.csv')
+
+BASELINE_FILE = 'drift_baseline.json'
+
+# Quantile bins per numeric feature (fewer when a feature has repeated values)
+NUMERIC_BINS = 10
+
+# Floor for empty bins in PSI, so a bin missing on one side does not make it infinite
+PSI_EPSILON = 1e-4
+
+# Usual PSI reading: below 0.1 stable, 0.1-0.25 moderate shift, above 0.25 significant
+PSI_THRESHOLDS = ((0.25, 'significant'), (0.1, 'moderate'), (0.0, 'stable'))
+
+# Rows the window needs before drift is reported (fewer would flag noise)
+MIN_WINDOW_ROWS = 100
+
+
+class DriftBaseline:
+    """Bin edges and training-data bin proportions of each input feature"""
+
+    def __init__(self, features, edges, proportions, categories=None, schema_hash=None, source=None, rows=0,
+                 created_at=None):
+        # edges[j] holds the lower bounds of feature j's bins after the first; a value
+        # falls in the bin of the last edge it reaches. categories maps categorical
+        # features to their labels, one per bin (their values are the category codes)
+        self.features = list(features)
+        self.edges = [np.asarray(edge, dtype=np.float64) for edge in edges]
+        self.proportions = [np.asarray(p, dtype=np.float64) for p in proportions]
+        self.categories = dict(categories or {})
+        self.schema_hash = schema_hash
+        self.source = source
+        self.rows = rows
+        self.created_at = created_at or time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+        # Edges padded to one matrix so a batch is binned with a single comparison
+        self.n_bins = max(len(edge) for edge in self.edges) + 1
+        self.edge_matrix = np.full((len(self.features), self.n_bins - 1), np.inf)
+        for j, edge in enumerate(self.edges):
+            self.edge_matrix[j, :len(edge)] = edge
+        self.offsets = np.arange(len(self.features)) * self.n_bins
+
+    def bin_indices(self, X):
+        """Flat (feature, bin) counter index of every value of a rows x features matrix"""
+        bins = (X[:, :, None] >= self.edge_matrix).sum(axis=2)
+        return bins + self.offsets
+
+    @classmethod
+    def from_matrix(cls, features, X, categories, bins=NUMERIC_BINS, **info):
+        """Baseline of a feature matrix; columns named in categories hold category codes"""
+        edges = []
+        for j, feature in enumerate(features):
+            if feature in categories:
+                edges.append(np.arange(1, len(categories[feature]), dtype=np.float64))
+            else:
+                edges.append(np.unique(np.quantile(X[:, j], np.linspace(0, 1, bins + 1)[1:-1])))
+
+        baseline = cls(features, edges, [np.zeros(len(edge) + 1) for edge in edges], categories,
+                       rows=len(X), **info)
+        counts = np.bincount(baseline.bin_indices(X).ravel(), minlength=len(features) * baseline.n_bins)
+        baseline.proportions = [counts[offset:offset + len(edge) + 1] / len(X)
+                                for offset, edge in zip(baseline.offsets, edges)]
+        return baseline
+
+    def save(self, directory=DEFAULT_ARTIFACT_DIR):
+        """Write the baseline atomically as JSON"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, BASELINE_FILE)
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'schema_hash': self.schema_hash,
+                'source': self.source,
+                'rows': self.rows,
+                'created_at': self.created_at,
+                'features': [{'name': feature, 'edges': edge.tolist(), 'proportions': p.tolist(),
+                              'categories': self.categories.get(feature)}
+                             for feature, edge, p in zip(self.features, self.edges, self.proportions)],
+            }, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, directory=DEFAULT_ARTIFACT_DIR, schema_hash=None):
+        """Load a saved baseline, or None if missing or taken for another feature schema"""
+        try:
+            with open(os.path.join(directory, BASELINE_FILE)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if schema_hash is not None and saved.get('schema_hash') != schema_hash:
+            return None
+        features = saved['features']
+        return cls([feature['name'] for feature in features], [feature['edges'] for feature in features],
+                   [feature['proportions'] for feature in features],
+                   {feature['name']: feature['categories'] for feature in features if feature['categories']},
+                   saved.get('schema_hash'), saved.get('source'), saved.get('rows', 0), saved.get('created_at'))
+
+
+def baseline_from_csv(model, path=DEFAULT_TRAINING_DATA, bins=NUMERIC_BINS):
+    """Baseline of the rows of a training CSV that the model would accept, encoded as it encodes them"""
+    import pandas as pd
+
+    frame = pd.read_csv(path)
+    frame = frame[~model.validate_frame(frame)]
+    X = model.build_feature_matrix(frame)[:, :len(model._base_columns)]
+    features = [feature for feature, _ in model._base_columns]
+    categories = {feature: model._category_classes[feature].tolist()
+                  for feature, lookup in model._base_columns if lookup is not None}
+    return DriftBaseline.from_matrix(features, X, categories, bins, schema_hash=model.artifact_key(),
+                                     source=os.path.abspath(path))
+
+
+def load_or_build_baseline(model, directory=DEFAULT_ARTIFACT_DIR, training_data=DEFAULT_TRAINING_DATA):
+    """Load the saved baseline, or take it once from the training data; None if neither exists"""
+    baseline = DriftBaseline.load(directory, model.artifact_key())
+    if baseline is not None or not os.path.exists(training_data):
+        return baseline
+
+    baseline = baseline_from_csv(model, training_data)
+    try:
+        baseline.save(directory)
+    except OSError as e:
+        print(f"⚠️ Could not save the drift baseline: {e}")
+        return baseline
+    print(f"📐 Drift baseline taken from {baseline.rows} rows of {training_data}")
+    return baseline
+
+
+def drift_status(psi):
+    """Reading of a PSI value"""
+    for threshold, status in PSI_THRESHOLDS:
+        if psi >= threshold:
+            return status
+    return 'stable'
+
+
+def population_stability_index(actual, expected):
+    """PSI of two bin proportion arrays"""
+    actual = np.maximum(actual, PSI_EPSILON)
+    expected = np.maximum(expected, PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+class _ThreadToken:
+    """Kept in a thread's locals; collected when the thread ends, which retires its shard"""
+
+
+class DriftMonitor:
+    """Sliding-window bin counts of live feature values, compared with a baseline on demand"""
+
+    def __init__(self, baseline, window_seconds=3600, slots=12, refresh_seconds=60, min_rows=MIN_WINDOW_ROWS,
+                 clock=time.monotonic):
+        # The window advances a slot at a time: counts older than window_seconds
+        # are dropped one slot_seconds step at a time
+        self.baseline = baseline
+        self.window_seconds = float(window_seconds)
+        self.slots = int(slots)
+        self.slot_seconds = self.window_seconds / self.slots
+        self.refresh_seconds = refresh_seconds
+        self.min_rows = min_rows
+        self._clock = clock
+        self._size = len(baseline.features) * baseline.n_bins
+        self._local = threading.local()
+        # Live threads' rings by id, and the counts of threads that have ended
+        self._shards = {}
+        self._base = self._new_ring()
+        self._lock = threading.Lock()
+        self._report_lock = threading.Lock()
+        self._report = None
+        self._report_time = None
+
+    def _new_ring(self):
+        """Empty (slot epochs, slots x counters) ring"""
+        return np.full(self.slots, -1, dtype=np.int64), np.zeros((self.slots, self._size), dtype=np.int64)
+
+    def _shard(self):
+        """This thread's ring"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._new_ring()
+            # Servers may start a thread per request, so ended threads' rings are folded away
+            token = self._local.token = _ThreadToken()
+            with self._lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(token, self._retire, shard)
+            return shard
+
+    def _retire(self, shard):
+        """Fold the ring of an ended thread into the base ring"""
+        epochs, counts = shard
+        with self._lock:
+            del self._shards[id(shard)]
+            base_epochs, base_counts = self._base
+            # A slot holds one epoch; the older of two is a full window old
+            same = epochs == base_epochs
+            base_counts[same] += counts[same]
+            newer = epochs > base_epochs
+            base_counts[newer] = counts[newer]
+            base_epochs[newer] = epochs[newer]
+
+    def observe(self, X):
+        """Count the rows of a matrix of the baseline's features (categoricals as codes)"""
+        epoch = int(self._clock() // self.slot_seconds)
+        slot = epoch % self.slots
+        epochs, counts = self._shard()
+        if epochs[slot] != epoch:
+            # The slot last held counts from a full window ago
+            counts[slot] = 0
+            epochs[slot] = epoch
+
+        indices = self.baseline.bin_indices(X)
+        if len(X) == 1:
+            # A single row touches each feature's counters once, so plain indexing adds correctly
+            counts[slot, indices[0]] += 1
+        else:
+            counts[slot] += np.bincount(indices.ravel(), minlength=self._size)
+
+    def window_counts(self):
+        """Bin counts of every thread over the current window, as a features x bins array"""
+        oldest = int(self._clock() // self.slot_seconds) - self.slots + 1
+        with self._lock:
+            base_epochs, base_counts = self._base
+            shards = [(base_epochs.copy(), base_counts.copy())] + list(self._shards.values())
+        total = np.zeros(self._size, dtype=np.int64)
+        for epochs, counts in shards:
+            # Writers are not stopped; a slot being reset may be read half cleared
+            total += counts[epochs >= oldest].sum(axis=0)
+        return total.reshape(len(self.baseline.features), self.baseline.n_bins)
+
+    def compute(self):
+        """PSI / KS of each feature over the current window against the baseline"""
+        baseline = self.baseline
+        counts = self.window_counts()
+        rows = int(counts[0].sum())
+
+        features = {}
+        for j, feature in enumerate(baseline.features):
+            expected = baseline.proportions[j]
+            entry = {'psi': None, 'ks': None, 'status': 'insufficient_data'}
+            if rows >= self.min_rows:
+                actual = counts[j, :len(expected)] / rows
+                entry['psi'] = round(population_stability_index(actual, expected), 6)
+                entry['status'] = drift_status(entry['psi'])
+                if feature in baseline.categories:
+                    entry['frequencies'] = {label: {'live': round(float(a), 6), 'baseline': round(float(e), 6)}
+                                            for label, a, e in zip(baseline.categories[feature], actual, expected)}
+                else:
+                    # KS distance of the two distributions, read at the bin edges
+                    entry['ks'] = round(float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected)))), 6)
+            features[feature] = entry
+
+        return {
+            'window_seconds': self.window_seconds,
+            'rows': rows,
+            'min_rows': self.min_rows,
+            'computed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'baseline': {'source': baseline.source, 'rows': baseline.rows, 'created_at': baseline.created_at},
+            'drifted': [feature for feature, entry in features.items() if entry['status'] == 'significant'],
+            'features': features,
+        }
+
+    def report(self, max_age=None):
+        """Latest drift report, recomputed when older than max_age (default refresh_seconds)"""
+        max_age = self.refresh_seconds if max_age is None else max_age
+        # Only readers take this lock; observe() never waits on a report being computed
+        with self._report_lock:
+            now = self._clock()
+            if self._report is None or now - self._report_time >= max_age:
+                self._report, self._report_time = self.compute(), now
+            return self._report
+
+    def collect_metrics(self):
+        """PSI / KS gauges of the latest report, for the metrics registry"""
+        report = self.report()
+        yield 'ml_drift_window_rows', 'gauge', 'Rows in the drift monitoring window', [([], report['rows'])]
+        for stat in ('psi', 'ks'):
+            samples = [([('feature', feature)], entry[stat]) for feature, entry in report['features'].items()
+                       if entry[stat] is not None]
+            if samples:
+                yield f'ml_feature_drift_{stat}', 'gauge', f'Feature {stat.upper()} of the window against the baseline', samples
+
+
+def main(argv=None):
+    from model import InteractiveMLModel
+
+    parser = argparse.ArgumentParser(description='Take the drift baseline from the training data')
+    parser.add_argument('training_data', nargs='?', default=DEFAULT_TRAINING_DATA,
+                        help='CSV in the beneficiary_dataset_preprocessed.csv format')
+    parser.add_argument('--baseline-dir', default=DEFAULT_ARTIFACT_DIR, help='directory the baseline is written to')
+    parser.add_argument('--bins', type=int, default=NUMERIC_BINS, help='quantile bins per numeric feature')
+    args = parser.parse_args(argv)
+
+    baseline = baseline_from_csv(InteractiveMLModel(), args.training_data, args.bins)
+    path = baseline.save(args.baseline_dir)
+    print(f"✅ Drift baseline of {len(baseline.features)} features from {baseline.rows} rows written to {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# Gunicorn configuration for the ML model server
+# Run with: gunicorn app:app   (this file is picked up automatically from the working directory)
+#
+# Preload mode loads (or trains and caches) the models once in the master process
+# before workers are forked, so every worker shares the same model pages
+# copy-on-write instead of holding its own copy.
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('ML_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('ML_WORKERS', min(4, multiprocessing.cpu_count())))
+
+# Threads per worker (gthread); micro-batching (ML_MICROBATCH=1) needs several
+# concurrent requests per worker to form batches
+threads = int(os.environ.get('ML_THREADS', 16 if os.environ.get('ML_MICROBATCH') == '1' else 1))
+
+# Set ML_PRELOAD=0 to load the models separately in every worker instead
+preload_app = os.environ.get('ML_PRELOAD', '1') == '1'
+
+
+def pre_fork(server, worker):
+    """Move everything allocated so far out of the GC's reach before forking"""
+    # Collections write to object headers, which would un-share the pages holding
+    # the preloaded models; frozen objects are never scanned
+    if preload_app:
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    """Let each worker reload its models on RELOAD_SIGNAL or a newly published bundle without being restarted"""
+    # Runs after gunicorn has reset the worker's signal handlers (and in the worker,
+    # since threads do not survive the fork)
+    from app import install_reload_signal, start_bundle_watcher
+    install_reload_signal()
+    start_bundle_watcher()
@@ -0,0 +1,157 @@
+# Incremental model updates from newly observed loan outcomes
+# New labelled rows are folded into the scaler's running mean / variance and
+# taught to the default-risk model (partial_fit, or extra trees / boosting stages
+# via warm_start) instead of retraining on the full history. Fitted models are
+# re-expressed in the updated scaler's space so their decisions on raw inputs
+# stay the same; models that cannot be moved exactly keep the old scaler.
+#
+# A batch earns trees (or stages) in proportion to its rows, at the rate the
+# model was trained with, so a handful of rows cannot outweigh the training data.
+# Ensembles are capped at MAX_ESTIMATOR_GROWTH times their size at the first
+# update: forests then drop their oldest trees, boosting has to be retrained.
+
+import copy
+
+import numpy as np
+from sklearn.ensemble import (RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier,
+                              HistGradientBoostingClassifier)
+
+# Rows per tree / stage when a model does not record how many rows it was trained on
+# (the demonstration forests are fitted on 1000 rows with 100 trees)
+ROWS_PER_ESTIMATOR = 10
+
+# Ensembles grow to at most this multiple of their size at the first update
+MAX_ESTIMATOR_GROWTH = 3
+
+
+def update_scaler(scaler, X):
+    """Copy of a fitted StandardScaler with the raw rows X added to its running statistics"""
+    scaler = copy.deepcopy(scaler)
+    scaler.partial_fit(X)
+    return scaler
+
+
+def scaler_mapping(old_scaler, new_scaler):
+    """(factor, shift) such that new_scaler.transform(x) == old_scaler.transform(x) * factor + shift"""
+    def mean_scale(scaler):
+        mean = scaler.mean_ if scaler.with_mean else 0.0
+        scale = scaler.scale_ if scaler.with_std else 1.0
+        return mean, scale
+
+    old_mean, old_scale = mean_scale(old_scaler)
+    new_mean, new_scale = mean_scale(new_scaler)
+    n_features = new_scaler.n_features_in_
+    factor = np.broadcast_to(np.asarray(old_scale / new_scale, dtype=np.float64), (n_features,))
+    shift = np.broadcast_to(np.asarray((old_mean - new_mean) / new_scale, dtype=np.float64), (n_features,))
+    return factor, shift
+
+
+def rescales_exactly(model):
+    """Whether rescale_model can move this model to new scaler statistics without changing a prediction"""
+    return isinstance(model, HistGradientBoostingClassifier) or (
+        hasattr(model, 'coef_') and hasattr(model, 'intercept_'))
+
+
+def rescale_model(model, factor, shift):
+    """Move a fitted model into a new scaled input space in place (see scaler_mapping)"""
+    if isinstance(model, HistGradientBoostingClassifier):
+        # Thresholds are compared in float64 and the map is monotone, so every row
+        # goes down the same branches
+        for iteration in model._predictors:
+            for predictor in iteration:
+                nodes = predictor.nodes
+                split = ~nodes['is_leaf'].astype(bool)
+                features = nodes['feature_idx'][split]
+                nodes['num_threshold'][split] = nodes['num_threshold'][split] * factor[features] + shift[features]
+        return model
+
+    if rescales_exactly(model):
+        # w . x_old + b == (w / factor) . x_new + b - (w / factor) . shift
+        coef = model.coef_ / factor
+        model.intercept_ = model.intercept_ - coef @ shift
+        model.coef_ = coef
+        return model
+
+    # Classic sklearn trees compare float32 inputs and can put thresholds within an ulp
+    # of training values, so moving them would flip rows that sit on those values
+    raise ValueError(f"Cannot move {type(model).__name__} to updated scaler statistics exactly")
+
+
+def n_estimators(model):
+    """Trees of a fitted forest, or stages of a fitted boosting model"""
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        return len(model.estimators_)
+    if isinstance(model, GradientBoostingClassifier):
+        return model.n_estimators_
+    if isinstance(model, HistGradientBoostingClassifier):
+        return model.n_iter_
+    raise ValueError(f"{type(model).__name__} supports neither partial_fit nor warm-started growth")
+
+
+def rows_learned(model):
+    """Rows a warm-started ensemble has been fitted on, as far as it records them"""
+    rows = getattr(model, 'n_rows_learned_', None) or getattr(model, '_n_samples', None)
+    return rows if rows is not None else n_estimators(model) * ROWS_PER_ESTIMATOR
+
+
+def new_estimators(model, n_rows):
+    """Trees / stages n_rows new rows earn: as many as the same rows got in training"""
+    return int(n_rows * n_estimators(model) // rows_learned(model))
+
+
+def can_learn(model, y):
+    """Whether learn_more can teach model the labels y now, or they have to wait for more rows"""
+    if hasattr(model, 'partial_fit'):
+        return True
+    # warm_start re-derives classes_ from y, so a batch must contain every known class
+    return np.array_equal(np.unique(y), model.classes_) and new_estimators(model, len(y)) > 0
+
+
+def learn_more(model, X, y):
+    """Teach a fitted classifier the scaled rows X in place; returns the model"""
+    if hasattr(model, 'partial_fit'):
+        model.partial_fit(X, y)
+        return model
+
+    if not np.array_equal(np.unique(y), model.classes_):
+        raise ValueError(f"New rows must contain every class the model predicts ({model.classes_.tolist()})")
+
+    current, rows = n_estimators(model), rows_learned(model)
+    limit = MAX_ESTIMATOR_GROWTH * getattr(model, 'n_initial_estimators_', current)
+    added = min(new_estimators(model, len(y)), limit)
+    if added < 1:
+        raise ValueError(f"{len(y)} rows are too few for a new estimator (one per {rows / current:.0f} rows)")
+
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        model.set_params(warm_start=True, n_estimators=current + added)
+        model.fit(X, y)
+        # Trees are independent, so the oldest make room for the new ones
+        excess = len(model.estimators_) - limit
+        if excess > 0:
+            model.estimators_ = model.estimators_[excess:]
+            model.set_params(n_estimators=len(model.estimators_))
+            rows = rows * (current - excess) / current
+    else:
+        # Stages correct the ones before them and cannot be dropped
+        added = min(added, limit - current)
+        if added < 1:
+            raise ValueError(f"{type(model).__name__} has reached {limit} stages; retrain it to learn more")
+        if isinstance(model, GradientBoostingClassifier):
+            model.set_params(warm_start=True, n_estimators=current + added)
+        else:
+            model.set_params(warm_start=True, max_iter=current + added)
+        model.fit(X, y)
+
+    model.n_initial_estimators_ = limit // MAX_ESTIMATOR_GROWTH
+    model.n_rows_learned_ = rows + len(y)
+    return model
+
+
+def update_model(model, mapping=None, X=None, y=None):
+    """Copy of a fitted model, moved by a scaler_mapping and taught (X, y) when given"""
+    model = copy.deepcopy(model)
+    if mapping is not None:
+        rescale_model(model, *mapping)
+    if y is not None:
+        learn_more(model, X, y)
+    return model
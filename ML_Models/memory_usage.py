@@ -0,0 +1,62 @@
+# Per-process memory statistics for the ML service
+# Used by /health to check how much model memory gunicorn workers actually share
+
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage, so no peak RSS either
+    resource = None
+
+
+def _read_kb_fields(path, fields):
+    """Read 'Name:   123 kB' style fields from a /proc file"""
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in fields:
+                    values[name] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def process_memory():
+    """RSS of this process in bytes, split into shared/private pages where the OS reports them"""
+    stats = {'pid': os.getpid()}
+
+    # Linux: smaps_rollup separates pages shared with the gunicorn master from private copies
+    rollup = _read_kb_fields('/proc/self/smaps_rollup',
+                             {'Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'})
+    if 'Rss' in rollup:
+        stats['rss_bytes'] = rollup['Rss']
+        stats['pss_bytes'] = rollup.get('Pss')
+        stats['shared_bytes'] = rollup.get('Shared_Clean', 0) + rollup.get('Shared_Dirty', 0)
+        stats['private_bytes'] = rollup.get('Private_Clean', 0) + rollup.get('Private_Dirty', 0)
+        return stats
+
+    status = _read_kb_fields('/proc/self/status', {'VmRSS'})
+    if 'VmRSS' in status:
+        stats['rss_bytes'] = status['VmRSS']
+        return stats
+
+    # Fallback: peak RSS
+    stats['max_rss_bytes'] = peak_rss_bytes()
+    return stats
+
+
+def peak_rss_bytes():
+    """Highest RSS this process has reached, in bytes (None where the OS does not report it)"""
+    # VmHWM starts afresh at exec, while ru_maxrss can carry over the parent's peak
+    status = _read_kb_fields('/proc/self/status', {'VmHWM'})
+    if 'VmHWM' in status:
+        return status['VmHWM']
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,206 @@
+# Prometheus-style metrics for the scoring service
+# Samples are recorded in per-thread shards (no lock on the hot path) and merged
+# when /metrics is scraped, so a timed stage costs two perf_counter() calls and
+# one bucket increment. The shard of a thread that ends is folded into a base. Metrics are per process: with several gunicorn workers
+# each one reports its own series.
+#
+# Usage:
+#   VALIDATE = STAGE_LATENCY.labels('validate')
+#   start = perf_counter()
+#   ...
+#   VALIDATE.observe(perf_counter() - start)
+
+import threading
+import weakref
+from bisect import bisect_left
+
+# Latency buckets in seconds, 5 microseconds to 2.5 seconds
+LATENCY_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Rows per scored batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+def format_sample(name, labels, value):
+    """One exposition line; labels is a list of (name, value) pairs"""
+    if labels:
+        escaped = ','.join('{}="{}"'.format(key, str(val).replace('\\', '\\\\').replace('"', '\\"')
+                                            .replace('\n', '\\n')) for key, val in labels)
+        name = f'{name}{{{escaped}}}'
+    if isinstance(value, float):
+        value = '+Inf' if value == float('inf') else repr(value)
+    return f'{name} {value}'
+
+
+class _Child:
+    """A metric bound to one combination of label values"""
+
+    __slots__ = ('_metric', '_key')
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        shard = self._metric._shard()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+    def observe(self, value):
+        shard = self._metric._shard()
+        counts = shard.get(self._key)
+        if counts is None:
+            counts = shard[self._key] = self._metric._empty()
+        counts[bisect_left(self._metric.buckets, value)] += 1
+        counts[-1] += value
+
+
+def _add_sample(totals, key, sample):
+    """Add a counter value or histogram count list into totals[key]"""
+    if isinstance(sample, list):
+        merged = totals.setdefault(key, [0] * len(sample))
+        for i, value in enumerate(sample):
+            merged[i] += value
+    else:
+        totals[key] = totals.get(key, 0) + sample
+
+
+class _ThreadToken:
+    """Kept in a thread's locals; collected when the thread ends, which retires its shard"""
+
+
+class _Metric:
+    """Labelled metric whose samples live in per-thread shards"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._local = threading.local()
+        # Live threads' shards by id, and the samples of threads that have ended
+        self._shards = {}
+        self._base = {}
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        """Child metric for these label values (cache it on hot paths)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, _Child(self, key))
+        return child
+
+    def _shard(self):
+        """This thread's {label values: sample} dict"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # Servers may start a thread per request, so ended threads' shards are folded away
+            token = self._local.token = _ThreadToken()
+            with self._lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(token, self._retire, shard)
+            return shard
+
+    def _retire(self, shard):
+        """Fold the shard of an ended thread into the base"""
+        with self._lock:
+            del self._shards[id(shard)]
+            for key, sample in shard.items():
+                _add_sample(self._base, key, sample)
+
+    def _merged(self):
+        """Samples of every thread added together, keyed by label values"""
+        totals = {}
+        with self._lock:
+            for key, sample in self._base.items():
+                _add_sample(totals, key, sample)
+            shards = list(self._shards.values())
+        for shard in shards:
+            for key, sample in list(shard.items()):
+                _add_sample(totals, key, sample)
+        return totals
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, sample in sorted(self._merged().items()):
+            lines.extend(self._render_sample(list(zip(self.label_names, key)), sample))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination"""
+
+    kind = 'counter'
+
+    def _render_sample(self, labels, total):
+        yield format_sample(self.name, labels, total)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution per label combination; buckets are made cumulative at scrape time"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _empty(self):
+        # One count per bucket, one for +Inf, then the running sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def _render_sample(self, labels, counts):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(float(bound))
+            yield format_sample(f'{self.name}_bucket', labels + [('le', le)], cumulative)
+        yield format_sample(f'{self.name}_sum', labels, float(counts[-1]))
+        yield format_sample(f'{self.name}_count', labels, cumulative)
+
+
+class Registry:
+    """Metrics plus callbacks for values that are read at scrape time"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() yields (name, kind, documentation, [(labels, value)]) with labels as (name, value) pairs"""
+        self.collectors.append(collect)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for name, kind, documentation, samples in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(format_sample(name, labels, value) for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'ml_requests_total', 'HTTP requests handled, by endpoint and status code', ('endpoint', 'status')))
+ERRORS = REGISTRY.register(Counter(
+    'ml_errors_total', 'Errors by type (validation, prediction or http_<status>)', ('type',)))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'ml_request_latency_seconds', 'End-to-end request latency', ('endpoint',)))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'ml_stage_latency_seconds', 'Latency of each step of the prediction path', ('stage',)))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'ml_batch_size_rows', 'Rows per scored batch, by scoring path', ('path',), buckets=BATCH_SIZE_BUCKETS))
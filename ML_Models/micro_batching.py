@@ -0,0 +1,86 @@
+# Request micro-batching for the ML model server
+# Concurrent /predict calls are queued for a short window and scored together as
+# one matrix, then each caller gets its own row of the result back
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collects single-row requests into batches scored by one background thread"""
+
+    def __init__(self, score_batch, max_batch_size=32, max_wait_ms=2.0):
+        # score_batch takes a list of inputs and returns a list of results in the same order
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._owner_pid = None
+
+        # Running totals, readable from /health
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queue one input and block until its result is ready"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def stats(self):
+        """Batch counters for monitoring"""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+        }
+
+    def _ensure_worker(self):
+        # Threads don't survive fork, so each gunicorn worker starts its own on first use
+        if self._thread is not None and self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._owner_pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._owner_pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes or the batch is full"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.score_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -1,22 +1,182 @@
 # Interactive ML Model for Income Band and Default Risk Prediction
 # Updated with exact 20 features as specified
 
-import pandas as pd
+# Serving only needs NumPy and the compiled artifacts: pandas and sklearn are
+# imported by the training, DataFrame and large-batch paths when they first run
+
+import os
+import sys
+import threading
+from collections import namedtuple
+from time import perf_counter
+
 import numpy as np
 import joblib
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.model_selection import train_test_split
 import warnings
 
+from tree_engine import CompiledTreeEnsemble, compile_ensemble, compile_scaler, check_parity
+from artifacts import (DEFAULT_ARTIFACT_DIR, schema_hash, write_bundle, read_bundle, read_manifest, resolve,
+                       bundle_generation, bundle_lock, read_pending, write_pending)
+from prediction_cache import PredictionCache
+from metrics import STAGE_LATENCY, BATCH_SIZE, ERRORS
+from request_decoding import FeatureRecord
+
 warnings.filterwarnings('ignore')
 
+# Batches up to this size are scored with the compiled tree engine; larger ones
+# go through sklearn, whose C loops win once per-call overhead is amortised
+COMPILED_MAX_ROWS = 32
+
+# Maximum predict_proba difference tolerated between sklearn and the compiled engine
+COMPILED_PARITY_TOLERANCE = 1e-9
+
+# Labelled rows kept waiting until an update can be learned; the oldest are dropped beyond it
+MAX_PENDING_UPDATES = 50000
+
+# Income band names in model class order
+INCOME_BANDS = ['Very Low', 'Low', 'Medium', 'High']
+
+# Composite credit score weights (from your notebook)
+W_RISK = 0.7
+W_INCOME = 0.3
+
+# Fixed recommendation texts (response_encoding pre-encodes them as JSON)
+RECOMMENDATION_TEXTS = {
+    'high_risk': ("HIGH RISK: Consider requiring collateral or co-signer",
+                  "Implement enhanced monitoring and payment reminders"),
+    'moderate_risk': ("MODERATE RISK: Consider reduced credit limits initially",
+                      "Offer financial literacy programs"),
+    'low_risk': ("LOW RISK: Eligible for standard credit terms",),
+    'low_income': ("Consider micro-lending or smaller loan amounts",
+                   "Provide financial education resources"),
+    'high_income': ("Eligible for premium financial products",
+                    "Consider cross-selling opportunities"),
+    'payment_behavior': ("Focus on payment behavior improvement",),
+    'asset_building': ("Consider asset-building financial products",),
+}
+PREVIOUS_DEFAULTS_TEXT = "Previous defaults ({}) - Enhanced risk monitoring required"
+
+# Risk / need labels and the customer segments they combine into
+RISK_LEVELS = ("High Risk", "Low Risk")
+NEED_LEVELS = ("High Need", "Low Need")
+
+# Prediction path metrics (see metrics.py), bound once so recording is a single call
+_VALIDATE_LATENCY = STAGE_LATENCY.labels('validate')
+_PREPROCESS_LATENCY = STAGE_LATENCY.labels('preprocess')
+_SCALE_LATENCY = STAGE_LATENCY.labels('scale')
+_DEFAULT_MODEL_LATENCY = STAGE_LATENCY.labels('default_model')
+_INCOME_MODEL_LATENCY = STAGE_LATENCY.labels('income_model')
+_RECOMMENDATIONS_LATENCY = STAGE_LATENCY.labels('recommendations')
+_COMPILED_BATCH_SIZE = BATCH_SIZE.labels('compiled')
+_SKLEARN_BATCH_SIZE = BATCH_SIZE.labels('sklearn')
+_VALIDATION_ERRORS = ERRORS.labels('validation')
+_PREDICTION_ERRORS = ERRORS.labels('prediction')
+
+# Model families: 'classic' (random forest + gradient boosting) or 'hist'
+# (histogram gradient boosting for both models, much faster to fit)
+MODEL_ENGINES = ('classic', 'hist')
+DEFAULT_MODEL_ENGINE = os.environ.get('ML_MODEL_ENGINE', 'classic')
+
+
+def make_models(engine=DEFAULT_MODEL_ENGINE):
+    """Unfitted (default risk, income band) classifiers of a model engine"""
+    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
+
+    if engine == 'classic':
+        return (RandomForestClassifier(n_estimators=100, random_state=42),
+                GradientBoostingClassifier(n_estimators=100, random_state=42))
+    if engine == 'hist':
+        return (HistGradientBoostingClassifier(max_iter=100, random_state=42),
+                HistGradientBoostingClassifier(max_iter=100, random_state=42))
+    raise ValueError(f"Unknown model engine '{engine}', expected one of {MODEL_ENGINES}")
+
+
+# Fitted scaler and models plus their compiled forms. Requests read the whole set
+# through one reference, so swapping in a new set never pairs a new model with an old scaler
+ModelSet = namedtuple('ModelSet', ['scaler', 'default_model', 'income_model',
+                                   'fast_scaler', 'fast_default_model', 'fast_income_model'])
+
+# Bundle files read on first use: the compiled forms serve single rows and small
+# batches, so the sklearn objects are only unpickled for large batches, updates and re-saves
+LAZY_ARTIFACTS = ('scaler', 'default_model', 'income_model')
+
+
+def _loaded(models):
+    """ModelSet with every deferred artifact read"""
+    return ModelSet(*[resolve(value) for value in models])
+
+
+def _is_frame(obj):
+    """Whether obj is a DataFrame, without importing pandas for callers that never use it"""
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(obj, pd.DataFrame)
+
+
+def _model_set_field(field):
+    """Attribute backed by one field of InteractiveMLModel.models"""
+    def fget(self):
+        return resolve(getattr(self.models, field))
+
+    def fset(self, value):
+        self.models = self.models._replace(**{field: value})
+
+    return property(fget, fset)
+
+
+def _encoder_field(name):
+    """LabelEncoder of one category, fitted on first access so sklearn is only imported when one is used"""
+    def fget(self):
+        encoder = self._encoders.get(name)
+        if encoder is None:
+            from sklearn.preprocessing import LabelEncoder
+            encoder = self._encoders[name] = LabelEncoder().fit(self._encoder_classes[name])
+        return encoder
+
+    def fset(self, encoder):
+        self._encoders[name] = encoder
+        self._encoder_classes[name] = encoder.classes_
+
+    return property(fget, fset)
+
+
+def _compiled_form(model, compiled):
+    """A bundle's compiled model; compacted bundles store the compiled ensemble as the model itself"""
+    if compiled is None:
+        model = resolve(model)
+        if isinstance(model, CompiledTreeEnsemble):
+            return model
+    return compiled
+
+
+def _bundle_model_set(bundle):
+    """ModelSet of the models stored in an artifact bundle"""
+    compiled = bundle['compiled']
+    default_model, income_model = bundle['default_model'], bundle['income_model']
+    return ModelSet(bundle['scaler'], default_model, income_model, compiled['scaler'],
+                    _compiled_form(default_model, compiled['default_model']),
+                    _compiled_form(income_model, compiled['income_model']))
+
 
 class InteractiveMLModel:
-    def __init__(self):
+    scaler = _model_set_field('scaler')
+    default_model = _model_set_field('default_model')
+    income_model = _model_set_field('income_model')
+    _fast_scaler = _model_set_field('fast_scaler')
+    _fast_default_model = _model_set_field('fast_default_model')
+    _fast_income_model = _model_set_field('fast_income_model')
+    region_encoder = _encoder_field('region')
+    education_encoder = _encoder_field('education_level')
+    occupation_encoder = _encoder_field('occupation')
+    income_encoder = _encoder_field('income_band')
+
+    def __init__(self, engine=None):
         """Initialize the interactive ML model with correct 20 feature definitions"""
 
+        # Model family trained by train_models (see make_models)
+        self.engine = engine or DEFAULT_MODEL_ENGINE
+        if self.engine not in MODEL_ENGINES:
+            raise ValueError(f"Unknown model engine '{self.engine}', expected one of {MODEL_ENGINES}")
+
         # Exact 20 features as specified by user
         self.feature_definitions = {
             'region': {'type': 'categorical', 'options': ['Rural', 'Urban']},
@@ -42,26 +202,68 @@ class InteractiveMLModel:
             'asset_score': {'type': 'numeric', 'range': (0, 10000)},
         }
 
-        # Initialize encoders and models
-        self.region_encoder = LabelEncoder()
-        self.education_encoder = LabelEncoder()
-        self.occupation_encoder = LabelEncoder()
-        self.scaler = StandardScaler()
+        # Compile the feature definitions once into a fast validator
+        self._compile_validation_schema()
 
-        # Fit encoders with expected values
-        self.region_encoder.fit(['Rural', 'Urban'])
-        self.education_encoder.fit(['Illiterate', 'Primary', 'Secondary', 'Graduate'])
-        self.occupation_encoder.fit(['Farmer','Shopkeeper','Laborer','Service','Others','DailyWage','SmallBusiness'])
+        # Scaler and models (load your trained models here); compiled copies are filled in by compile_models
+        self.models = ModelSet(None, None, None, None, None, None)
 
-        # Create and train models (load your trained models here)
-        self.default_model = None
-        self.income_model = None
-        self.income_encoder = LabelEncoder()
-        self.income_encoder.fit(['Very Low', 'Low', 'Medium', 'High'])
+        # Classes of the category encoders, sorted as LabelEncoder.fit sorts them; the
+        # LabelEncoder objects themselves are only built when asked for
+        self._encoder_classes = {
+            'region': np.unique(['Rural', 'Urban']),
+            'education_level': np.unique(['Illiterate', 'Primary', 'Secondary', 'Graduate']),
+            'occupation': np.unique(['Farmer','Shopkeeper','Laborer','Service','Others','DailyWage','SmallBusiness']),
+            'income_band': np.unique(INCOME_BANDS),
+        }
+        self._encoders = {}
+
+        # Model feature order (20 base + 5 engineered = 25 total)
+        self.feature_order = [
+            'region_encoded', 'household_size', 'num_loans', 'avg_loan_amount', 'on_time_ratio',
+            'avg_days_late', 'max_dpd', 'num_defaults', 'avg_kwh_30d', 'var_kwh_30d',
+            'seasonality_index', 'avg_recharge_amount', 'recharge_freq_30d', 'last_recharge_days',
+            'bill_on_time_ratio', 'avg_bill_delay', 'avg_bill_amount', 'education_encoded',
+            'occupation_encoded', 'asset_score', 'loan_per_household', 'kwh_per_household',
+            'recharge_intensity', 'payment_reliability', 'financial_stability'
+        ]
+        self._feature_index = {feature: j for j, feature in enumerate(self.feature_order)}
+
+        # Precomputed category -> code lookups matching the fitted LabelEncoders
+        self._encoded_sources = {
+            'region_encoded': 'region',
+            'education_encoded': 'education_level',
+            'occupation_encoded': 'occupation',
+        }
+        self._build_category_lookups()
+
+        # Name of each model column in explanations: encoded columns are reported
+        # under their input feature, engineered ones under their own name
+        self.explanation_features = [self._encoded_sources.get(feature, feature) for feature in self.feature_order]
 
         # Model training status
         self.models_trained = False
 
+        # Optional result cache for repeated inputs (see enable_prediction_cache)
+        self.prediction_cache = None
+
+        # Optional portfolio percentile index of composite scores (see set_score_index)
+        self.score_index = None
+
+        # Optional monitor of the scored inputs' feature distributions (see set_drift_monitor)
+        self.drift_monitor = None
+
+        # Bundle generation the served models were read from (None if they were not)
+        self.artifact_generation = None
+
+        # (raw feature rows, default labels) waiting to be learned (see update_models)
+        self.pending_updates = None
+
+        # Serialises model updates; readers never take it (see update_models)
+        self._update_lock = threading.Lock()
+
+    def describe(self):
+        """Print the feature summary banner"""
         print("Interactive ML Model initialized with 20 features!")
         print("Features: region, household_size, num_loans, avg_loan_amount, on_time_ratio,")
         print("         avg_days_late, max_dpd, num_defaults, avg_kwh_30d, var_kwh_30d,")
@@ -71,28 +273,306 @@ class InteractiveMLModel:
     def load_trained_models(self, default_model_path=None, income_model_path=None, scaler_path=None):
         """Load your trained models from saved files"""
         try:
-            if default_model_path:
-                self.default_model = joblib.load(default_model_path)
-                print(f"✅ Default risk model loaded from {default_model_path}")
-
-            if income_model_path:
-                self.income_model = joblib.load(income_model_path)
-                print(f"✅ Income band model loaded from {income_model_path}")
-
-            if scaler_path:
-                self.scaler = joblib.load(scaler_path)
-                print(f"✅ Scaler loaded from {scaler_path}")
-
-            if self.default_model and self.income_model:
-                self.models_trained = True
-                print("✅ All models loaded successfully!")
+            models = self.load_model_set(default_model_path=default_model_path,
+                                         income_model_path=income_model_path, scaler_path=scaler_path)
+
+            # Swap the complete set in at once so no request sees a half-loaded mix
+            with self._update_lock:
+                self.models = models
+                self.artifact_generation = None
+                if models.default_model is not None and models.income_model is not None:
+                    self.models_trained = True
+                    print("✅ All models loaded successfully!")
+                self._clear_prediction_cache()
 
         except Exception as e:
             print(f"❌ Error loading models: {e}")
             print("🔄 Will use demonstration models instead")
 
+    def load_model_set(self, cache_dir=None, default_model_path=None, income_model_path=None, scaler_path=None,
+                       manifest=None):
+        """Load a complete ModelSet from an artifact bundle or model files, leaving the live set untouched"""
+        if cache_dir is not None:
+            bundle = read_bundle(cache_dir, self.artifact_key(), lazy=LAZY_ARTIFACTS, manifest=manifest)
+            if bundle is None:
+                raise FileNotFoundError(f"No artifact bundle for schema {self.artifact_key()} in {cache_dir}")
+            print(f"✅ Model artifacts read from {cache_dir}")
+            return _bundle_model_set(bundle)
+
+        # Files that are not given keep the current model
+        current = _loaded(self.models)
+        default_model, income_model, scaler = current.default_model, current.income_model, current.scaler
+        if default_model_path:
+            default_model = joblib.load(default_model_path)
+            print(f"✅ Default risk model loaded from {default_model_path}")
+
+        if income_model_path:
+            income_model = joblib.load(income_model_path)
+            print(f"✅ Income band model loaded from {income_model_path}")
+
+        if scaler_path:
+            scaler = joblib.load(scaler_path)
+            print(f"✅ Scaler loaded from {scaler_path}")
+
+        if default_model is None or income_model is None:
+            return ModelSet(scaler, default_model, income_model, compile_scaler(scaler), None, None)
+        return self._compile_model_set(scaler, default_model, income_model)
+
+    def smoke_test(self, models):
+        """Score sample rows with a candidate ModelSet; returns a list of problems (empty if it looks sane)"""
+        models = _loaded(models)
+        rows = self.create_sample_data_for_training()[0].to_numpy()[:256]
+        rows = np.vstack([rows, self.build_feature_matrix([create_sample_input()])])
+
+        try:
+            X = models.scaler.transform(rows)
+            default_probs = models.default_model.predict_proba(X)
+            income_probs = models.income_model.predict_proba(X)
+        except Exception as e:
+            return [f"Scoring sample rows failed: {e}"]
+
+        problems = []
+        for name, probs, n_classes in (('default_model', default_probs, 2),
+                                       ('income_model', income_probs, len(INCOME_BANDS))):
+            if probs.shape != (len(rows), n_classes):
+                problems.append(f"{name} returned probabilities of shape {probs.shape}")
+            elif not (np.isfinite(probs).all() and np.allclose(probs.sum(axis=1), 1.0)):
+                problems.append(f"{name} returned invalid probabilities")
+
+        # Compiled copies (possibly read from disk) must still agree with sklearn
+        for name, fast_name, model in (('scaler', 'fast_scaler', models.scaler),
+                                       ('default_model', 'fast_default_model', models.default_model),
+                                       ('income_model', 'fast_income_model', models.income_model)):
+            fast = getattr(models, fast_name)
+            if fast is None:
+                continue
+            try:
+                if name == 'scaler':
+                    difference = float(np.max(np.abs(fast.transform(rows) - X)))
+                else:
+                    difference = check_parity(model, fast, X)
+            except Exception as e:
+                problems.append(f"Compiled {name} could not be checked: {e}")
+                continue
+            if not difference <= COMPILED_PARITY_TOLERANCE:
+                problems.append(f"Compiled {name} differs from sklearn by {difference:.3g}")
+
+        return problems
+
+    def reload_models(self, cache_dir=None, default_model_path=None, income_model_path=None, scaler_path=None):
+        """Load, smoke-test and atomically swap in new models; the live set keeps serving until then"""
+        manifest = read_manifest(cache_dir, self.artifact_key()) if cache_dir is not None else None
+        models = self.load_model_set(cache_dir, default_model_path, income_model_path, scaler_path, manifest)
+        if models.default_model is None or models.income_model is None:
+            raise ValueError("Reload needs both a default risk model and an income band model")
+
+        problems = self.smoke_test(models)
+        if problems:
+            raise ValueError("New models failed the smoke test: " + "; ".join(problems))
+
+        # One reference assignment; requests already scoring finish on the old set
+        with self._update_lock:
+            self.models = models
+            self.models_trained = True
+            self.artifact_generation = manifest['generation'] if manifest is not None else None
+            self._clear_prediction_cache()
+        print("🔄 Models reloaded")
+
+    def artifact_key(self):
+        """Schema hash identifying artifact bundles compatible with this model"""
+        return schema_hash(self.feature_definitions, self.feature_order, self.engine)
+
+    def save_artifact_bundle(self, cache_dir=DEFAULT_ARTIFACT_DIR, replace=False):
+        """Persist models, scaler, compiled trees and encoder classes as a versioned bundle
+
+        With replace the bundle becomes the published one even if one exists (see write_bundle).
+        """
+        path = write_bundle(cache_dir, self.artifact_key(), {
+            'default_model': self.default_model,
+            'income_model': self.income_model,
+            'scaler': self.scaler,
+            'compiled': {
+                'scaler': self._fast_scaler,
+                'default_model': self._fast_default_model,
+                'income_model': self._fast_income_model,
+            },
+        }, extra={
+            # Encoder classes, so loading a bundle never has to unpickle LabelEncoders
+            'encoder_classes': {name: classes.tolist() for name, classes in self._encoder_classes.items()},
+        }, replace=replace)
+        if replace:
+            self.artifact_generation = bundle_generation(cache_dir, self.artifact_key())
+        print(f"💾 Model artifacts saved to {path}")
+        return path
+
+    def load_artifact_bundle(self, cache_dir=DEFAULT_ARTIFACT_DIR):
+        """Load a bundle matching the current schema from its manifest; returns True on success
+
+        Only the compiled artifacts are read now (memory-mapped); the sklearn objects
+        are read on first use (see LAZY_ARTIFACTS).
+        """
+        try:
+            key = self.artifact_key()
+            manifest = read_manifest(cache_dir, key)
+            bundle = read_bundle(cache_dir, key, lazy=LAZY_ARTIFACTS, manifest=manifest)
+        except Exception as e:
+            print(f"❌ Error loading model artifacts: {e}")
+            return False
+
+        if bundle is None:
+            return False
+
+        self._encoder_classes = {name: np.array(classes) for name, classes in manifest['encoder_classes'].items()}
+        self._encoders = {}
+        self._build_category_lookups()
+
+        # Compiled trees passed the parity check before they were saved
+        self.models = _bundle_model_set(bundle)
+        self.artifact_generation = manifest['generation']
+        self._clear_prediction_cache()
+
+        self.models_trained = True
+        print(f"✅ Model artifacts loaded from {cache_dir}")
+        return True
+
+    def load_or_train_models(self, cache_dir=DEFAULT_ARTIFACT_DIR):
+        """Load cached artifacts, or train the demonstration models once and cache them"""
+        if self.models_trained or self.load_artifact_bundle(cache_dir):
+            return
+
+        self.train_models()
+        try:
+            self.save_artifact_bundle(cache_dir)
+        except OSError as e:
+            print(f"⚠️ Could not cache model artifacts: {e}")
+            return
+
+        # Reload so the large arrays are read-only file-backed mappings: those pages are
+        # shared between forked gunicorn workers instead of being copied per process
+        self.models_trained = False
+        self.load_artifact_bundle(cache_dir)
+
+    def load_deferred_artifacts(self):
+        """Read every artifact left for first use, e.g. before forking workers that should share them"""
+        with self._update_lock:
+            self.models = _loaded(self.models)
+
+    def warm_up(self, cache_dir=DEFAULT_ARTIFACT_DIR):
+        """Make the models ready and run one prediction so first real requests are not slowed down"""
+        self.load_or_train_models(cache_dir)
+        self.predict(create_sample_input())
+
+    def _build_category_lookups(self):
+        """Derive category -> code lookups from the encoder classes"""
+        self._category_classes = {
+            feature: self._encoder_classes[feature] for feature in ('region', 'education_level', 'occupation')
+        }
+        self._category_codes = {
+            feature: {label: code for code, label in enumerate(classes)}
+            for feature, classes in self._category_classes.items()
+        }
+        self._base_columns = [
+            (self._encoded_sources.get(feature, feature),
+             self._category_codes.get(self._encoded_sources.get(feature)))
+            for feature in self.feature_order[:20]
+        ]
+
+    def _compile_validation_schema(self):
+        """Compile feature_definitions once into lookup sets and bound arrays for fast validation"""
+        self._categorical_checks = [
+            (feature, frozenset(definition['options']))
+            for feature, definition in self.feature_definitions.items()
+            if definition['type'] == 'categorical'
+        ]
+        self._numeric_features = [
+            feature for feature, definition in self.feature_definitions.items()
+            if definition['type'] == 'numeric'
+        ]
+        self._numeric_min = np.array([self.feature_definitions[f]['range'][0] for f in self._numeric_features],
+                                     dtype=np.float64)
+        self._numeric_max = np.array([self.feature_definitions[f]['range'][1] for f in self._numeric_features],
+                                     dtype=np.float64)
+        self._numeric_bounds = [
+            (feature, *self.feature_definitions[feature]['range']) for feature in self._numeric_features
+        ]
+
     def validate_input(self, user_input):
         """Validate user input against feature definitions"""
+        # Fast check on the compiled schema; errors are only built when it fails
+        try:
+            valid = (all(user_input[feature] in options for feature, options in self._categorical_checks)
+                     and all(min_val <= float(user_input[feature]) <= max_val
+                             for feature, min_val, max_val in self._numeric_bounds))
+        except (KeyError, ValueError, TypeError):
+            valid = False
+
+        return [] if valid else self._row_errors(user_input)
+
+    def validate_batch(self, user_inputs):
+        """Validate a list of inputs; returns (per-row error lists, boolean error mask)"""
+        n_rows = len(user_inputs)
+        n_numeric = len(self._numeric_features)
+
+        # Convert every numeric field with float(), exactly as the per-row check does
+        try:
+            values = np.fromiter(
+                (float(row[feature]) for row in user_inputs for feature in self._numeric_features),
+                dtype=np.float64, count=n_rows * n_numeric).reshape(n_rows, n_numeric)
+        except (KeyError, ValueError, TypeError):
+            # Some rows are missing or malformed; NaN marks them so they fail the bounds check
+            values = np.array([self._numeric_values(row) for row in user_inputs],
+                              dtype=np.float64).reshape(n_rows, n_numeric)
+
+        # Single vectorized bounds check (NaN compares False and is flagged)
+        error_mask = ~((values >= self._numeric_min) & (values <= self._numeric_max)).all(axis=1)
+
+        for feature, options in self._categorical_checks:
+            try:
+                error_mask |= np.fromiter((row.get(feature) not in options for row in user_inputs),
+                                          dtype=bool, count=n_rows)
+            except TypeError:
+                # Unhashable values can't be looked up in a frozenset; send every row to the slow path
+                error_mask[:] = True
+
+        # Error messages are only built for rows that failed a fast check
+        errors = [self._row_errors(user_inputs[i]) if error_mask[i] else [] for i in range(n_rows)]
+        if error_mask.any():
+            error_mask = np.fromiter((bool(row_errors) for row_errors in errors), dtype=bool, count=n_rows)
+
+        return errors, error_mask
+
+    def validate_frame(self, frame):
+        """Vectorized validation of a DataFrame; returns a boolean error mask"""
+        import pandas as pd
+
+        n_rows = len(frame)
+        if not set(self.feature_definitions).issubset(frame.columns):
+            return np.ones(n_rows, dtype=bool)
+
+        error_mask = np.zeros(n_rows, dtype=bool)
+        for feature, options in self._categorical_checks:
+            error_mask |= ~frame[feature].isin(options).to_numpy()
+
+        # Non-numeric values become NaN and fail the bounds check
+        values = np.column_stack([
+            pd.to_numeric(frame[feature], errors='coerce').to_numpy(dtype=np.float64)
+            for feature in self._numeric_features
+        ])
+        error_mask |= ~((values >= self._numeric_min) & (values <= self._numeric_max)).all(axis=1)
+        return error_mask
+
+    def _numeric_values(self, user_input):
+        """Numeric fields of one row as floats, NaN where missing or not a number"""
+        values = []
+        for feature in self._numeric_features:
+            try:
+                values.append(float(user_input[feature]))
+            except (KeyError, ValueError, TypeError):
+                values.append(np.nan)
+        return values
+
+    def _row_errors(self, user_input):
+        """Build the validation error messages for one row"""
         errors = []
 
         for feature, definition in self.feature_definitions.items():
@@ -119,50 +599,51 @@ class InteractiveMLModel:
 
     def preprocess_input(self, user_input):
         """Preprocess user input for model prediction"""
+        return self.build_feature_matrix([user_input])
+
+    def build_feature_matrix(self, user_inputs):
+        """Build the 25-column feature matrix from a list of inputs or a DataFrame in one pass"""
+        X = np.empty((len(user_inputs), len(self.feature_order)), dtype=np.float64)
+
+        # Base features, encoding categorical variables via precomputed lookups
+        if _is_frame(user_inputs):
+            import pandas as pd
+            for j, (feature, lookup) in enumerate(self._base_columns):
+                if lookup is None:
+                    X[:, j] = user_inputs[feature].to_numpy(dtype=np.float64)
+                    continue
+                # Categorical codes against the encoder classes are exactly LabelEncoder codes
+                codes = pd.Categorical(user_inputs[feature], categories=self._category_classes[feature]).codes
+                if (codes < 0).any():
+                    raise ValueError(f"{feature} contains previously unseen labels")
+                X[:, j] = codes
+        else:
+            X[:, :len(self._base_columns)] = [
+                [row[feature] if lookup is None else lookup[row[feature]] for feature, lookup in self._base_columns]
+                for row in user_inputs
+            ]
 
-        # Create a copy to avoid modifying original
-        processed = user_input.copy()
-
-        # Encode categorical variables
-        processed['region_encoded'] = self.region_encoder.transform([processed['region']])[0]
-        processed['education_encoded'] = self.education_encoder.transform([processed['education_level']])[0]
-        processed['occupation_encoded'] = self.occupation_encoder.transform([processed['occupation']])[0]
-
-        # Remove original categorical columns
-        del processed['region']
-        del processed['education_level']
-        del processed['occupation']
+        return self._add_engineered_features(X)
 
+    def _add_engineered_features(self, X):
+        """Fill the 5 engineered columns of a feature matrix from its 20 base columns"""
         # Create engineered features (based on your notebook)
-        processed['loan_per_household'] = processed['avg_loan_amount'] / processed['household_size'] if processed[
-                                                                                                            'household_size'] > 0 else 0
-        processed['kwh_per_household'] = processed['avg_kwh_30d'] / processed['household_size'] if processed[
-                                                                                                       'household_size'] > 0 else 0
-        processed['recharge_intensity'] = processed['avg_recharge_amount'] / processed['recharge_freq_30d'] if \
-        processed['recharge_freq_30d'] > 0 else 0
-        processed['payment_reliability'] = (processed['on_time_ratio'] + processed['bill_on_time_ratio']) / 2
-        processed['financial_stability'] = processed['asset_score'] - processed['avg_days_late'] / 10 - processed[
-            'num_defaults']
-
-        # Convert to DataFrame with proper feature order (20 base + 5 engineered = 25 total)
-        feature_order = [
-            'region_encoded', 'household_size', 'num_loans', 'avg_loan_amount', 'on_time_ratio',
-            'avg_days_late', 'max_dpd', 'num_defaults', 'avg_kwh_30d', 'var_kwh_30d',
-            'seasonality_index', 'avg_recharge_amount', 'recharge_freq_30d', 'last_recharge_days',
-            'bill_on_time_ratio', 'avg_bill_delay', 'avg_bill_amount', 'education_encoded',
-            'occupation_encoded', 'asset_score', 'loan_per_household', 'kwh_per_household',
-            'recharge_intensity', 'payment_reliability', 'financial_stability'
-        ]
-
-        # Create feature vector
-        feature_vector = []
-        for feature in feature_order:
-            if feature in processed:
-                feature_vector.append(float(processed[feature]))
-            else:
-                feature_vector.append(0.0)  # Default value for missing engineered features
-
-        return np.array(feature_vector).reshape(1, -1)
+        col = self._feature_index
+        household_size = X[:, col['household_size']]
+        recharge_freq = X[:, col['recharge_freq_30d']]
+        for feature, numerator, denominator in (
+                ('loan_per_household', 'avg_loan_amount', household_size),
+                ('kwh_per_household', 'avg_kwh_30d', household_size),
+                ('recharge_intensity', 'avg_recharge_amount', recharge_freq)):
+            # Ratio is 0 when the denominator is not positive
+            out = X[:, col[feature]]
+            out.fill(0.0)
+            np.divide(X[:, col[numerator]], denominator, out=out, where=denominator > 0)
+        X[:, col['payment_reliability']] = (X[:, col['on_time_ratio']] + X[:, col['bill_on_time_ratio']]) / 2
+        X[:, col['financial_stability']] = (X[:, col['asset_score']] - X[:, col['avg_days_late']] / 10
+                                            - X[:, col['num_defaults']])
+
+        return X
 
     def create_sample_data_for_training(self):
         """Create sample data to train demonstration models"""
@@ -201,6 +682,7 @@ class InteractiveMLModel:
         data['payment_reliability'] = (data['on_time_ratio'] + data['bill_on_time_ratio']) / 2
         data['financial_stability'] = data['asset_score'] - data['avg_days_late'] / 10 - data['num_defaults']
 
+        import pandas as pd
         X = pd.DataFrame(data)
 
         # Create synthetic targets with num_defaults included
@@ -235,11 +717,12 @@ class InteractiveMLModel:
         X, y_default, y_income = self.create_sample_data_for_training()
 
         # Scale features
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
 
         # Train models
-        self.default_model = RandomForestClassifier(n_estimators=100, random_state=42)
-        self.income_model = GradientBoostingClassifier(n_estimators=100, random_state=42)
+        self.default_model, self.income_model = make_models(self.engine)
 
         self.default_model.fit(X_scaled, y_default)
         self.income_model.fit(X_scaled, y_income)
@@ -247,6 +730,8 @@ class InteractiveMLModel:
         self.models_trained = True
         print("Models trained successfully!")
 
+        self.compile_models()
+
         # Print model performance
         default_acc = self.default_model.score(X_scaled, y_default)
         income_acc = self.income_model.score(X_scaled, y_income)
@@ -255,93 +740,431 @@ class InteractiveMLModel:
 
     def predict(self, user_input):
         """Make predictions for user input"""
+        return self.predict_batch([user_input])[0]
+
+    def _validate_rows(self, user_inputs):
+        """Validate dicts or decoded FeatureRecords; returns (dict rows, records or None, results, valid row indices)"""
+        records = None
+        if any(type(row) is FeatureRecord for row in user_inputs):
+            if all(type(row) is FeatureRecord for row in user_inputs):
+                records = user_inputs
+            user_inputs = [row.fields if type(row) is FeatureRecord else row for row in user_inputs]
+        results = [None] * len(user_inputs)
+
+        # Validate every row first; only valid rows are scored. Decoded records were
+        # checked against the same schema while they were decoded
+        start = perf_counter()
+        if records is not None:
+            error_mask = np.fromiter((not record.valid for record in records), dtype=bool, count=len(records))
+            errors = [self._row_errors(user_inputs[i]) if error_mask[i] else [] for i in range(len(records))]
+        elif len(user_inputs) == 1:
+            errors = [self.validate_input(user_inputs[0])]
+            error_mask = np.array([bool(errors[0])])
+        else:
+            errors, error_mask = self.validate_batch(user_inputs)
+        _VALIDATE_LATENCY.observe(perf_counter() - start)
+
+        invalid_rows = np.flatnonzero(error_mask)
+        if len(invalid_rows):
+            _VALIDATION_ERRORS.inc(len(invalid_rows))
+        for i in invalid_rows:
+            results[i] = {'success': False, 'errors': errors[i]}
+        return user_inputs, records, results, np.flatnonzero(~error_mask).tolist()
+
+    def _rows_matrix(self, user_inputs, records, rows):
+        """Feature matrix of the given (validated) rows"""
+        start = perf_counter()
+        if records is not None:
+            X = np.empty((len(rows), len(self.feature_order)), dtype=np.float64)
+            X[:, :len(self._base_columns)] = [records[i].values for i in rows]
+            X = self._add_engineered_features(X)
+        else:
+            X = self.build_feature_matrix([user_inputs[i] for i in rows])
+        _PREPROCESS_LATENCY.observe(perf_counter() - start)
+        return X
 
-        # Validate input
-        errors = self.validate_input(user_input)
-        if errors:
-            return {'success': False, 'errors': errors}
+    def predict_batch(self, user_inputs):
+        """Make predictions for a list of user inputs (dicts or decoded FeatureRecords) in one vectorized pass"""
+        user_inputs, records, results, valid_rows = self._validate_rows(user_inputs)
 
-        # Train models if not already done
+        if not valid_rows:
+            return results
+
+        # Load cached models, or train them once, if not already done
         if not self.models_trained:
-            self.train_models()
+            self.load_or_train_models()
+
+        # Answer repeated inputs from the result cache; only misses are scored
+        cache = self.prediction_cache
+        if cache is not None:
+            cache_keys = {i: self._cache_key(user_inputs[i]) for i in valid_rows}
+            for i in valid_rows:
+                results[i] = cache.get(cache_keys[i])
+            valid_rows = [i for i in valid_rows if results[i] is None]
+            if not valid_rows:
+                return results
 
         try:
-            # Preprocess input
-            X = self.preprocess_input(user_input)
-            X_scaled = self.scaler.transform(X)
-
-            # Make predictions
-            default_prob = self.default_model.predict_proba(X_scaled)[0, 1]  # Probability of default
-            income_pred = self.income_model.predict(X_scaled)[0]
-            income_probs = self.income_model.predict_proba(X_scaled)[0]
-
-            # Get income band name
-            income_bands = ['Very Low', 'Low', 'Medium', 'High']
-            predicted_income_band = income_bands[income_pred]
-
-            # Create composite score
-            income_score = np.dot(income_probs, [0, 1, 2, 3])  # Weighted sum
-            income_score_norm = income_score / 3  # Normalize to 0-1
-
-            # Composite credit score (from your notebook)
-            w_risk = 0.7
-            w_income = 0.3
-            composite_score = w_income * income_score_norm + w_risk * (1 - default_prob)
-
-            # Risk and need categorization
-            risk_level = "High Risk" if default_prob > 0.5 else "Low Risk"
-            need_level = "High Need" if income_score_norm < 0.5 else "Low Need"
-            segment = f"{risk_level} {need_level}"
-
-            return {
+            # Preprocess all valid rows into a single 2-D matrix
+            X = self._rows_matrix(user_inputs, records, valid_rows)
+            default_probs, income_preds, income_probs = self._score_matrix(X)
+
+            monitor = self.drift_monitor
+            if monitor is not None:
+                monitor.observe(X[:, :len(self._base_columns)])
+
+            for row, i in enumerate(valid_rows):
+                results[i] = self._format_prediction(
+                    default_probs[row], income_preds[row], income_probs[row], user_inputs[i])
+                if cache is not None:
+                    cache.put(cache_keys[i], results[i])
+
+        except Exception as e:
+            if len(valid_rows) == 1:
+                _PREDICTION_ERRORS.inc()
+                results[valid_rows[0]] = {'success': False, 'errors': [f"Prediction error: {str(e)}"]}
+            else:
+                # Re-score rows one by one so a single bad row cannot fail the whole batch
+                for i in valid_rows:
+                    results[i] = self.predict_batch([user_inputs[i]])[0]
+
+        return results
+
+    def explain(self, user_input):
+        """Per-feature contributions behind one input's default risk and income band"""
+        return self.explain_batch([user_input])[0]
+
+    def explain_batch(self, user_inputs):
+        """Exact per-feature Shapley values (path-dependent TreeSHAP) for a list of inputs
+
+        Each row's contributions plus the base value add up to the predicted
+        probability. Boosted models are additive in log-odds: their Shapley values
+        are computed there and scaled onto the probability, so both engines report
+        the same output. Default risk is explained for the default class, income
+        for the predicted band.
+        Contributions are a list of {feature, contribution}, largest absolute value first.
+        """
+        user_inputs, records, results, valid_rows = self._validate_rows(user_inputs)
+        if not valid_rows:
+            return results
+
+        if not self.models_trained:
+            self.load_or_train_models()
+        models = self.models
+
+        scaler = models.fast_scaler or resolve(models.scaler)
+        X_scaled = scaler.transform(self._rows_matrix(user_inputs, records, valid_rows))
+        default = self._explain_model(models.default_model, models.fast_default_model, X_scaled, class_of=1)
+        income = self._explain_model(models.income_model, models.fast_income_model, X_scaled)
+
+        for row, i in enumerate(valid_rows):
+            income_explanation = income[row]
+            income_explanation['band'] = INCOME_BANDS[income_explanation.pop('class')]
+            default_explanation = default[row]
+            del default_explanation['class']
+            results[i] = {
                 'success': True,
-                'predictions': {
-                    'default_risk_probability': round(float(default_prob), 4),
-                    'default_risk_category': risk_level,
-                    'predicted_income_band': predicted_income_band,
-                    'income_band_probabilities': {
-                        band: round(float(prob), 4)
-                        for band, prob in zip(income_bands, income_probs)
-                    },
-                    'income_score_normalized': round(float(income_score_norm), 4),
-                    'composite_credit_score': round(float(composite_score), 4),
-                    'customer_segment': segment,
-                    'recommendations': self._generate_recommendations(default_prob, income_score_norm, user_input)
-                }
+                'explanation': {'default_risk': default_explanation, 'income_band': income_explanation}
             }
+        return results
 
-        except Exception as e:
-            return {'success': False, 'errors': [f"Prediction error: {str(e)}"]}
+    def _explain_model(self, model, compiled, X_scaled, class_of=None):
+        """Contributions of one model for every row, towards class_of (or each row's predicted class)"""
+        if not isinstance(compiled, CompiledTreeEnsemble) or compiled.cover is None:
+            raise ValueError(f"Explanations need a compiled tree ensemble, not {type(resolve(model)).__name__}")
+
+        if class_of is not None:
+            classes = np.full(len(X_scaled), list(compiled.classes_).index(class_of))
+        else:
+            classes = np.argmax(compiled.predict_proba(X_scaled), axis=1)
+        # A binary boosted model has a single margin column, that of the positive class
+        columns = 0 if compiled.value.shape[1] == 1 else classes
+        base, contributions = compiled.contributions(X_scaled, columns)
+        if compiled.link != 'mean':
+            # From the margin onto the class probability, keeping every contribution's share
+            rows = np.arange(len(X_scaled))
+            value = compiled.predict_proba(X_scaled)[rows, classes]
+            base = compiled.proba_from_raw(compiled.expected_value()[None, :].copy())[0, classes]
+            margin = contributions.sum(axis=1)
+            scale = np.divide(value - base, margin, out=value * (1 - value), where=np.abs(margin) > 1e-12)
+            contributions = contributions * scale[:, None]
+
+        explanations = []
+        for row, cls in enumerate(classes.tolist()):
+            values = contributions[row]
+            order = np.argsort(-np.abs(values), kind='stable')
+            explanations.append({
+                'class': compiled.classes_[cls].item(),
+                'method': 'tree_shap',
+                'output': 'probability',
+                'base_value': round(float(base[row]), 6),
+                # + 0.0 turns a rounded -0.0 into 0.0
+                'value': round(float(base[row] + values.sum()), 6) + 0.0,
+                # A list keeps the order through JSON encoding with sorted keys
+                'contributions': [{'feature': self.explanation_features[j], 'contribution': round(float(values[j]), 6)}
+                                  for j in order],
+            })
+        return explanations
+
+    def score_frame(self, frame):
+        """Vectorized scoring of a DataFrame; returns (scores DataFrame for valid rows, error mask)"""
+        import pandas as pd
+
+        error_mask = self.validate_frame(frame)
+        valid = frame[~error_mask]
+
+        if not self.models_trained:
+            self.load_or_train_models()
+
+        columns = ['default_risk_proba', 'income_score_norm', 'composite_score']
+        if valid.empty:
+            return pd.DataFrame(columns=columns, dtype=np.float64), error_mask
+
+        default_probs, _, income_probs = self._score_matrix(self.build_feature_matrix(valid))
+        income_score_norm = income_probs @ np.arange(len(INCOME_BANDS), dtype=np.float64) / 3
+        composite_score = W_INCOME * income_score_norm + W_RISK * (1 - default_probs)
+
+        scores = pd.DataFrame({
+            'default_risk_proba': default_probs,
+            'income_score_norm': income_score_norm,
+            'composite_score': composite_score,
+        }, index=valid.index)
+        return scores, error_mask
+
+    def _score_matrix(self, X):
+        """Scale a feature matrix and run both models; returns default probs, income preds and probs"""
+        use_compiled = len(X) <= COMPILED_MAX_ROWS
+        (_COMPILED_BATCH_SIZE if use_compiled else _SKLEARN_BATCH_SIZE).observe(len(X))
+
+        # Read the model set once so the whole batch sees a single consistent version
+        models = self.models
+        scaler = models.fast_scaler if use_compiled and models.fast_scaler else resolve(models.scaler)
+        start = perf_counter()
+        X_scaled = scaler.transform(X)
+        _SCALE_LATENCY.observe(perf_counter() - start)
+
+        # One predict_proba call per model for the whole batch
+        default_model = (models.fast_default_model if use_compiled and models.fast_default_model
+                         else resolve(models.default_model))
+        income_model = (models.fast_income_model if use_compiled and models.fast_income_model
+                        else resolve(models.income_model))
+
+        start = perf_counter()
+        default_probs = default_model.predict_proba(X_scaled)[:, 1]  # Probability of default
+        scored = perf_counter()
+        _DEFAULT_MODEL_LATENCY.observe(scored - start)
+        income_probs = income_model.predict_proba(X_scaled)
+        _INCOME_MODEL_LATENCY.observe(perf_counter() - scored)
+        income_preds = income_model.classes_[np.argmax(income_probs, axis=1)]
+
+        return default_probs, income_preds, income_probs
+
+    def enable_prediction_cache(self, max_entries=10000, ttl_seconds=None):
+        """Cache results of repeated inputs in a bounded LRU (optionally expiring after ttl_seconds)"""
+        self.prediction_cache = PredictionCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def set_score_index(self, index):
+        """Report each prediction's percentile and credit band against a ScoreIndex (None to stop)"""
+        self.score_index = index
+        self._clear_prediction_cache()
+
+    def set_drift_monitor(self, monitor):
+        """Count the input features of every row scored from now on into monitor (None to stop)"""
+        self.drift_monitor = monitor
+
+    def _clear_prediction_cache(self):
+        """Drop cached results; called whenever the models change"""
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+
+    def _cache_key(self, user_input):
+        """Canonical key of a validated input: the 20 features in schema order"""
+        # Numbers are normalised to float so 4 and 4.0 share an entry; num_defaults is
+        # also keyed by its text because the recommendations echo it verbatim
+        return (tuple(float(user_input[feature]) for feature in self._numeric_features)
+                + tuple(user_input[feature] for feature, _ in self._categorical_checks)
+                + (str(user_input['num_defaults']),))
+
+    def compile_models(self):
+        """Flatten the fitted scaler and tree ensembles into NumPy arrays for fast small-batch scoring"""
+        if self.models_trained:
+            self.models = self._compile_model_set(self.scaler, self.default_model, self.income_model)
+        else:
+            self.models = self.models._replace(
+                fast_scaler=compile_scaler(self.scaler), fast_default_model=None, fast_income_model=None)
+        self._clear_prediction_cache()
+
+    def _compile_model_set(self, scaler, default_model, income_model):
+        """ModelSet of fitted models plus the compiled forms that pass the parity check"""
+        compiled = {'default_model': None, 'income_model': None}
+
+        # Only keep a compiled model if it reproduces sklearn's probabilities on sample rows
+        rows = self.create_sample_data_for_training()[0].to_numpy()[:256]
+        X_check = scaler.transform(rows)
+        for name, model in (('default_model', default_model), ('income_model', income_model)):
+            try:
+                fast = compile_ensemble(model)
+                if fast is not None and check_parity(model, fast, X_check) <= COMPILED_PARITY_TOLERANCE:
+                    compiled[name] = fast
+            except Exception as e:
+                print(f"⚠️ Could not compile {type(model).__name__}, using sklearn: {e}")
+
+        # The compiled scaler feeds every small batch, so it is held to the same tolerance
+        fast_scaler = compile_scaler(scaler)
+        if fast_scaler is not None and not np.max(np.abs(fast_scaler.transform(rows) - X_check)) <= COMPILED_PARITY_TOLERANCE:
+            print(f"⚠️ Compiled scaler differs from {type(scaler).__name__}, using sklearn")
+            fast_scaler = None
+
+        return ModelSet(scaler, default_model, income_model,
+                        fast_scaler, compiled['default_model'], compiled['income_model'])
+
+    def update_models(self, user_inputs, default_labels):
+        """Learn newly observed loan outcomes without a full retrain; returns the number of rows learned
+
+        Warm-started ensembles are grown on the new rows alone, which need both
+        outcomes and enough rows for a new tree (see incremental.can_learn). Until
+        then they wait in pending_updates and 0 is returned.
+        """
+        if len(user_inputs) != len(default_labels):
+            raise ValueError(f"Got {len(user_inputs)} inputs but {len(default_labels)} labels")
+
+        if not self.models_trained:
+            self.load_or_train_models()
+
+        # Rows the serving model would reject are not learned from either
+        _, error_mask = self.validate_batch(user_inputs)
+        rows = [row for row, invalid in zip(user_inputs, error_mask) if not invalid]
+        if not rows:
+            return 0
+        X = self.build_feature_matrix(rows)
+        y = np.asarray(default_labels)[~error_mask].astype(int)
+
+        from incremental import update_scaler, scaler_mapping, rescales_exactly, update_model, can_learn
+
+        # Build the complete new set off to the side; the live one keeps serving meanwhile
+        with self._update_lock:
+            if self.pending_updates is not None:
+                X = np.vstack([self.pending_updates[0], X])
+                y = np.concatenate([self.pending_updates[1], y])
+
+            models = _loaded(self.models)
+            if not can_learn(models.default_model, y):
+                self.pending_updates = (X[-MAX_PENDING_UPDATES:], y[-MAX_PENDING_UPDATES:])
+                print(f"⏳ {len(y)} loan outcomes buffered until the default model can learn them")
+                return 0
+
+            if rescales_exactly(models.default_model) and rescales_exactly(models.income_model):
+                scaler = update_scaler(models.scaler, X)
+                mapping = scaler_mapping(models.scaler, scaler)
+            else:
+                # Classic trees don't depend on feature scale; new trees are grown in their existing space
+                scaler, mapping = models.scaler, None
+            default_model = update_model(models.default_model, mapping, scaler.transform(X), y)
+            income_model = update_model(models.income_model, mapping)
+
+            # One reference assignment swaps scaler, models and compiled trees together
+            self.models = self._compile_model_set(scaler, default_model, income_model)
+            self.pending_updates = None
+            # Not any saved bundle's models until save_artifact_bundle publishes them
+            self.artifact_generation = None
+            self._clear_prediction_cache()
+        print(f"🔄 Models updated with {len(y)} new loan outcomes")
+        return len(y)
+
+    def publish_update(self, user_inputs, default_labels, cache_dir=DEFAULT_ARTIFACT_DIR):
+        """update_models on top of the published bundle, then publish the result
+
+        Processes take turns under the bundle lock and each starts from the latest
+        published generation and its buffered rows, so updates taken by different
+        workers all survive. Returns (rows learned, rows buffered, persisted).
+        """
+        key = self.artifact_key()
+        with bundle_lock(cache_dir, key):
+            published = bundle_generation(cache_dir, key)
+            if published is not None and published != self.artifact_generation:
+                # Another process published an update this one has not reloaded yet
+                self.reload_models(cache_dir)
+            self.pending_updates = read_pending(cache_dir, key)
+
+            learned = self.update_models(user_inputs, default_labels)
+            pending = 0 if self.pending_updates is None else len(self.pending_updates[1])
+            try:
+                if learned:
+                    self.save_artifact_bundle(cache_dir, replace=True)
+                # Only cleared once the rows are in a published bundle
+                write_pending(cache_dir, key, self.pending_updates)
+            except OSError as e:
+                print(f"⚠️ Could not save the updated models: {e}")
+                return learned, pending, False
+        return learned, pending, True
+
+    def _format_prediction(self, default_prob, income_pred, income_probs, user_input):
+        """Build the response payload for one scored row"""
+
+        # Get income band name
+        predicted_income_band = INCOME_BANDS[income_pred]
+
+        # Create composite score
+        income_score = np.dot(income_probs, [0, 1, 2, 3])  # Weighted sum
+        income_score_norm = income_score / 3  # Normalize to 0-1
+
+        # Composite credit score (from your notebook)
+        composite_score = W_INCOME * income_score_norm + W_RISK * (1 - default_prob)
+
+        # Risk and need categorization
+        risk_level = RISK_LEVELS[0] if default_prob > 0.5 else RISK_LEVELS[1]
+        need_level = NEED_LEVELS[0] if income_score_norm < 0.5 else NEED_LEVELS[1]
+        segment = f"{risk_level} {need_level}"
+
+        start = perf_counter()
+        recommendations = self._generate_recommendations(default_prob, income_score_norm, user_input)
+        _RECOMMENDATIONS_LATENCY.observe(perf_counter() - start)
+
+        predictions = {
+            'default_risk_probability': round(float(default_prob), 4),
+            'default_risk_category': risk_level,
+            'predicted_income_band': predicted_income_band,
+            'income_band_probabilities': {
+                band: round(float(prob), 4)
+                for band, prob in zip(INCOME_BANDS, income_probs)
+            },
+            'income_score_normalized': round(float(income_score_norm), 4),
+            'composite_credit_score': round(float(composite_score), 4),
+            'customer_segment': segment,
+            'recommendations': recommendations
+        }
+
+        # Rank against the scored portfolio: two binary searches on the sorted index
+        score_index = self.score_index
+        if score_index is not None:
+            predictions['portfolio_percentile'], predictions['credit_band'] = score_index.lookup(float(composite_score))
+
+        return {'success': True, 'predictions': predictions}
 
     def _generate_recommendations(self, default_prob, income_score, user_input):
         """Generate recommendations based on predictions"""
         recommendations = []
 
         if default_prob > 0.7:
-            recommendations.append("HIGH RISK: Consider requiring collateral or co-signer")
-            recommendations.append("Implement enhanced monitoring and payment reminders")
+            recommendations.extend(RECOMMENDATION_TEXTS['high_risk'])
         elif default_prob > 0.5:
-            recommendations.append("MODERATE RISK: Consider reduced credit limits initially")
-            recommendations.append("Offer financial literacy programs")
+            recommendations.extend(RECOMMENDATION_TEXTS['moderate_risk'])
         else:
-            recommendations.append("LOW RISK: Eligible for standard credit terms")
+            recommendations.extend(RECOMMENDATION_TEXTS['low_risk'])
 
         if income_score < 0.3:
-            recommendations.append("Consider micro-lending or smaller loan amounts")
-            recommendations.append("Provide financial education resources")
+            recommendations.extend(RECOMMENDATION_TEXTS['low_income'])
         elif income_score > 0.7:
-            recommendations.append("Eligible for premium financial products")
-            recommendations.append("Consider cross-selling opportunities")
+            recommendations.extend(RECOMMENDATION_TEXTS['high_income'])
 
         if user_input.get('num_defaults', 0) > 0:
-            recommendations.append(
-                f"Previous defaults ({user_input['num_defaults']}) - Enhanced risk monitoring required")
+            recommendations.append(PREVIOUS_DEFAULTS_TEXT.format(user_input['num_defaults']))
 
         if user_input.get('on_time_ratio', 1.0) < 0.6:
-            recommendations.append("Focus on payment behavior improvement")
+            recommendations.extend(RECOMMENDATION_TEXTS['payment_behavior'])
 
         if user_input.get('asset_score', 0) < 2:
-            recommendations.append("Consider asset-building financial products")
+            recommendations.extend(RECOMMENDATION_TEXTS['asset_building'])
 
         return recommendations
 
@@ -375,6 +1198,7 @@ def create_sample_input():
 if __name__ == "__main__":
     # Initialize the model
     model = InteractiveMLModel()
+    model.describe()
 
     # To load your trained models, uncomment and modify these lines:
     # model.load_trained_models(
@@ -0,0 +1,139 @@
+# Opt-in request profiling for the scoring service
+# With ML_PROFILING=1 a request is profiled when it sends "X-Profile: 1" or
+# "?profile=1", or when it is picked by 1-in-N sampling (ML_PROFILE_SAMPLE_N=N).
+# A profiled request is run under cProfile and the stats are written to a
+# rotating directory (ML_PROFILE_DIR, newest ML_PROFILE_KEEP files kept); asking
+# for "collapsed" instead returns the call stacks inline in the collapsed format
+# read by flamegraph.pl and speedscope.
+# Without ML_PROFILING=1 the decorator returns the view unchanged, so normal
+# traffic pays nothing.
+#
+# Usage:
+#   curl -H 'X-Profile: 1' ...                 -> X-Profile-File: <.prof file name in ML_PROFILE_DIR>
+#   curl '.../predict?profile=collapsed' ...   -> text/plain, "a;b;c <microseconds>" per line
+
+import cProfile
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, make_response, request
+
+PROFILING_ENABLED = os.environ.get('ML_PROFILING') == '1'
+PROFILE_SAMPLE_N = int(os.environ.get('ML_PROFILE_SAMPLE_N', 0))
+PROFILE_DIR = os.environ.get('ML_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_KEEP = int(os.environ.get('ML_PROFILE_KEEP', 50))
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY = 'profile'
+
+_request_counter = itertools.count(1)
+_dump_counter = itertools.count(1)
+_rotate_lock = threading.Lock()
+
+
+def profile_mode():
+    """'cprofile', 'collapsed' or None for the current request"""
+    value = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY)
+    if value:
+        value = value.lower()
+        if value == 'collapsed':
+            return 'collapsed'
+        if value in ('1', 'true', 'cprofile'):
+            return 'cprofile'
+    if PROFILE_SAMPLE_N > 0 and next(_request_counter) % PROFILE_SAMPLE_N == 0:
+        return 'cprofile'
+    return None
+
+
+class CollapsedStackProfiler:
+    """Deterministic profiler that adds up the self time of every distinct call stack"""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self._stack = []  # [label, entered at, time spent in children]
+
+    @staticmethod
+    def _label(frame, event, arg):
+        if event.startswith('c_'):
+            module = getattr(arg, '__module__', None) or 'builtins'
+            return f"{module}.{getattr(arg, '__qualname__', repr(arg))}"
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _trace(self, frame, event, arg):
+        now = time.perf_counter()
+        if event in ('call', 'c_call'):
+            self._stack.append([self._label(frame, event, arg), now, 0.0])
+        elif self._stack and event in ('return', 'c_return', 'c_exception'):
+            label, entered, children = self._stack.pop()
+            elapsed = now - entered
+            key = ';'.join([entry[0] for entry in self._stack] + [label])
+            self.totals[key] += elapsed - children
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def runcall(self, fn, *args, **kwargs):
+        sys.setprofile(self._trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sys.setprofile(None)
+            # Frames still open when tracing stopped (the view itself) are dropped
+            self._stack.clear()
+
+    def collapsed(self):
+        """One "frame;frame;frame microseconds" line per stack, heaviest first"""
+        lines = sorted(self.totals.items(), key=lambda item: -item[1])
+        return '\n'.join(f"{stack} {max(1, round(seconds * 1e6))}" for stack, seconds in lines) + '\n'
+
+
+def dump_profile(profiler):
+    """Write cProfile stats to PROFILE_DIR, keeping only the newest PROFILE_KEEP files; returns the path"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_dump_counter)}.prof"
+    path = os.path.join(PROFILE_DIR, name)
+    profiler.dump_stats(path)
+
+    with _rotate_lock:
+        files = [os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith('.prof')]
+        files.sort(key=os.path.getmtime)
+        for old in files[:max(0, len(files) - PROFILE_KEEP)]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return path
+
+
+def profiled(view):
+    """Profile a Flask view when the request asks for it (see module header)"""
+    if not PROFILING_ENABLED:
+        return view
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = profile_mode()
+        if mode is None:
+            return view(*args, **kwargs)
+
+        # Lets the view keep the model call on this thread (e.g. skip micro-batching)
+        g.profiling = True
+        if mode == 'collapsed':
+            profiler = CollapsedStackProfiler()
+            response = make_response(profiler.runcall(view, *args, **kwargs))
+            stacks = make_response(profiler.collapsed())
+            stacks.mimetype = 'text/plain'
+            stacks.headers['X-Profile-Status'] = str(response.status_code)
+            return stacks
+
+        profiler = cProfile.Profile()
+        response = make_response(profiler.runcall(view, *args, **kwargs))
+        response.headers['X-Profile-File'] = os.path.basename(dump_profile(profiler))
+        return response
+
+    return wrapper
@@ -0,0 +1,127 @@
+# Fast JSON encoding of prediction responses
+# A successful prediction always has the same nested shape, so it is written by
+# filling a template: keys, band labels, segments and the fixed recommendation
+# texts are JSON-encoded once at import, and only the rounded floats (and the
+# rare free-text recommendation) are formatted per response. The output is the
+# same compact, key-sorted, ASCII-escaped text Flask's jsonify produces, so
+# clients see identical bytes. Any other shape (errors, unexpected values) is
+# encoded by the standard json module with the same settings.
+# The rounded probabilities and scores are formatted in one orjson call when
+# orjson is installed; for values in [0, 1] (and percentiles rounded to 2
+# decimals in [0, 100]) its shortest float text is exactly Python's repr.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from model import INCOME_BANDS, RECOMMENDATION_TEXTS, RISK_LEVELS, NEED_LEVELS
+from score_index import CREDIT_CATEGORIES
+
+
+def dumps(obj):
+    """Compact, key-sorted JSON, as jsonify writes it outside debug mode"""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def _encode_strings(texts):
+    return {text: json.dumps(text) for text in texts}
+
+
+# Pre-encoded string values of a prediction
+_BAND_FRAGMENTS = _encode_strings(INCOME_BANDS)
+_RISK_FRAGMENTS = _encode_strings(RISK_LEVELS)
+_SEGMENT_FRAGMENTS = _encode_strings(f"{risk} {need}" for risk in RISK_LEVELS for need in NEED_LEVELS)
+_RECOMMENDATION_FRAGMENTS = _encode_strings(text for texts in RECOMMENDATION_TEXTS.values() for text in texts)
+_CREDIT_BAND_FRAGMENTS = _encode_strings(CREDIT_CATEGORIES)
+
+# income_band_probabilities keys in sorted order, each with its '"key":' prefix
+_SORTED_BANDS = [(band, json.dumps(band) + ':') for band in sorted(INCOME_BANDS)]
+_PREDICTION_KEYS = frozenset([
+    'composite_credit_score', 'customer_segment', 'default_risk_category', 'default_risk_probability',
+    'income_band_probabilities', 'income_score_normalized', 'predicted_income_band', 'recommendations'])
+# With a portfolio score index the prediction also carries its rank
+_INDEXED_PREDICTION_KEYS = _PREDICTION_KEYS | {'credit_band', 'portfolio_percentile'}
+
+
+def _numbers(values):
+    """JSON text of each float in values, all of which must lie in [0, 1]"""
+    for value in values:
+        if type(value) is not float or not 0.0 <= value <= 1.0:
+            raise ValueError
+    if orjson is not None:
+        return orjson.dumps(values)[1:-1].decode().split(',')
+    return [repr(value) for value in values]
+
+
+def _percentile(value):
+    """JSON text of a portfolio percentile in [0, 100]"""
+    if type(value) is not float or not 0.0 <= value <= 100.0:
+        raise ValueError
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return repr(value)
+
+
+def _string(fragments, text):
+    fragment = fragments.get(text)
+    if fragment is not None:
+        return fragment
+    if type(text) is not str:
+        raise ValueError
+    return json.dumps(text)
+
+
+def _encode_prediction(result):
+    """Template encoding of a successful prediction; raises on any other shape"""
+    if len(result) != 2 or result['success'] is not True:
+        raise ValueError
+    p = result['predictions']
+    keys = p.keys()
+    if keys == _PREDICTION_KEYS:
+        credit_band = percentile = ''
+    elif keys == _INDEXED_PREDICTION_KEYS:
+        credit_band = ',"credit_band":' + _string(_CREDIT_BAND_FRAGMENTS, p['credit_band'])
+        percentile = ',"portfolio_percentile":' + _percentile(p['portfolio_percentile'])
+    else:
+        raise ValueError
+    probabilities = p['income_band_probabilities']
+    if len(probabilities) != len(_SORTED_BANDS):
+        raise ValueError
+
+    composite, default_risk, income_score, *bands = _numbers(
+        [p['composite_credit_score'], p['default_risk_probability'], p['income_score_normalized']]
+        + [probabilities[band] for band, _ in _SORTED_BANDS])
+    bands = ','.join([prefix + text for (_, prefix), text in zip(_SORTED_BANDS, bands)])
+    recommendations = ','.join([_string(_RECOMMENDATION_FRAGMENTS, text) for text in p['recommendations']])
+    return (
+        '{"predictions":{"composite_credit_score":' + composite + credit_band
+        + ',"customer_segment":' + _SEGMENT_FRAGMENTS[p['customer_segment']]
+        + ',"default_risk_category":' + _RISK_FRAGMENTS[p['default_risk_category']]
+        + ',"default_risk_probability":' + default_risk
+        + ',"income_band_probabilities":{' + bands
+        + '},"income_score_normalized":' + income_score + percentile
+        + ',"predicted_income_band":' + _BAND_FRAGMENTS[p['predicted_income_band']]
+        + ',"recommendations":[' + recommendations + ']},"success":true}'
+    )
+
+
+def encode_result(result):
+    """JSON text of one predict() result"""
+    try:
+        return _encode_prediction(result)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return dumps(result)
+
+
+def encode_batch(results):
+    """JSON text of the /predict/batch envelope around a list of results"""
+    return ('{"count":' + str(len(results)) + ',"results":['
+            + ','.join([encode_result(result) for result in results]) + '],"success":true}')
+
+
+def encode_ndjson(results):
+    """NDJSON text of a list of results, one line each"""
+    return ''.join([encode_result(result) + '\n' for result in results])
@@ -0,0 +1,189 @@
+# Portfolio percentile index for composite credit scores
+# The composite scores the served models give a population (the beneficiaries of
+# beneficiary_dataset_preprocessed.csv, or the rows of a bulk_score run) are kept
+# sorted in a .npy file next to the model artifacts, with the score edges of its
+# credit categories (quartiles, as the notebook's pd.qcut) in a small JSON sidecar.
+# The sidecar names the models that produced the scores (artifact schema hash and
+# bundle generation), so an index is rebuilt rather than reused after a model swap.
+# A prediction's percentile and credit band are then two binary searches, so the
+# population is never scanned or sorted per request. The array is memory-mapped
+# on load, so forked workers share one copy of its pages.
+#
+# Usage (from ML_Models): python -m score_index [beneficiary_dataset_preprocessed.csv] [--artifact-dir DIR]
+
+import argparse
+import bisect
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from artifacts import DEFAULT_ARTIFACT_DIR
+
+# Credit categories of composite_credit_scores.csv, lowest first
+CREDIT_CATEGORIES = ['Low', 'Medium', 'High', 'Excellent']
+
+# Quartile cut points of the composite scores in composite_credit_scores.csv
+# (the notebook assigns categories with pd.qcut(..., 4), right-inclusive); used
+# by bulk_score when no index of the served models exists
+CREDIT_CATEGORY_EDGES = [0.5520792933125506, 0.7635771737028307, 0.8735670915827003]
+
+DEFAULT_POPULATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'beneficiary_dataset_preprocessed.csv')
+
+INDEX_FILE = 'score_index.npy'
+INDEX_META_FILE = 'score_index.json'
+
+SCORE_COLUMN = 'composite_score'
+
+
+class ScoreIndex:
+    """Sorted population scores answering percentile and credit band lookups in O(log n)"""
+
+    def __init__(self, scores, edges=CREDIT_CATEGORY_EDGES, categories=CREDIT_CATEGORIES, source=None, models=None):
+        # scores must already be sorted ascending; a score equal to an edge belongs
+        # to the lower category, as with pd.qcut
+        if len(scores) == 0:
+            raise ValueError("A score index needs at least one score")
+        if len(edges) != len(categories) - 1:
+            raise ValueError("Credit categories need one edge fewer than categories")
+        # Plain ndarray view: memmap's subclass hooks would double the cost of each search
+        self.scores = np.asarray(scores)
+        self.edges = [float(edge) for edge in edges]
+        self.categories = list(categories)
+        self.source = source
+        # model_identity() of the models that scored the population
+        self.models = models
+
+    def __len__(self):
+        return len(self.scores)
+
+    def percentile(self, score):
+        """Percentage of the population scoring at or below score"""
+        rank = int(np.searchsorted(self.scores, score, side='right'))
+        return 100.0 * rank / len(self.scores)
+
+    def credit_band(self, score):
+        """Credit category of score"""
+        return self.categories[bisect.bisect_left(self.edges, score)]
+
+    def lookup(self, score):
+        """(percentile rounded to 2 decimals, credit category) of one composite score"""
+        return round(self.percentile(score), 2), self.credit_band(score)
+
+    @classmethod
+    def from_scores(cls, scores, edges=None, source=None, models=None):
+        """Index of an unsorted score array; bands default to its quartiles"""
+        scores = np.sort(np.asarray(scores, dtype=np.float64))
+        return cls(scores, quartile_edges(scores) if edges is None else edges, source=source, models=models)
+
+    def save(self, directory=DEFAULT_ARTIFACT_DIR):
+        """Write the index atomically; a running service picks it up on its next reload"""
+        os.makedirs(directory, exist_ok=True)
+        suffix = f'.tmp-{os.getpid()}'
+        index_path = os.path.join(directory, INDEX_FILE)
+        meta_path = os.path.join(directory, INDEX_META_FILE)
+
+        with open(index_path + suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.scores, dtype=np.float64))
+        meta = {
+            'count': len(self.scores),
+            'categories': self.categories,
+            'edges': self.edges,
+            'source': self.source,
+            'models': self.models,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        # The count in the sidecar lets load() reject a pair caught between the two renames
+        os.replace(index_path + suffix, index_path)
+        os.replace(meta_path + suffix, meta_path)
+        return index_path
+
+    @classmethod
+    def load(cls, directory=DEFAULT_ARTIFACT_DIR, models=None, mmap_mode='r'):
+        """Load a saved index (memory-mapped), or None if missing, inconsistent or scored by other models"""
+        try:
+            with open(os.path.join(directory, INDEX_META_FILE)) as f:
+                meta = json.load(f)
+            scores = np.load(os.path.join(directory, INDEX_FILE), mmap_mode=mmap_mode)
+        except (OSError, ValueError):
+            return None
+
+        if scores.ndim != 1 or len(scores) != meta.get('count'):
+            return None
+        if models is not None and meta.get('models') != models:
+            return None
+        return cls(scores, meta['edges'], meta['categories'], meta.get('source'), meta.get('models'))
+
+
+def quartile_edges(scores):
+    """Credit category edges of sorted scores, the cut points pd.qcut(scores, 4) uses"""
+    return np.quantile(scores, [0.25, 0.5, 0.75]).tolist()
+
+
+def model_identity(model):
+    """The served models an index belongs to: artifact schema hash and bundle generation"""
+    return {'schema_hash': model.artifact_key(), 'generation': model.artifact_generation}
+
+
+def index_from_model(model, population=DEFAULT_POPULATION, chunksize=100000):
+    """Index of the composite scores the model gives the valid rows of a population CSV, read in chunks"""
+    import pandas as pd
+
+    parts = []
+    for chunk in pd.read_csv(population, usecols=list(model.feature_definitions), chunksize=chunksize):
+        scores, _ = model.score_frame(chunk)
+        parts.append(scores[SCORE_COLUMN].to_numpy(dtype=np.float64))
+    return ScoreIndex.from_scores(np.concatenate(parts), source=os.path.abspath(population),
+                                  models=model_identity(model))
+
+
+def load_or_build_index(model, directory=DEFAULT_ARTIFACT_DIR, population=DEFAULT_POPULATION):
+    """Index of the model's current scores: the saved one if it matches, else built from the population
+
+    Returns None if neither exists. Models not read from a bundle have no generation,
+    so their index is always rebuilt and never saved.
+    """
+    identity = model_identity(model)
+    index = ScoreIndex.load(directory, identity) if identity['generation'] is not None else None
+    if index is not None or not os.path.exists(population):
+        return index
+
+    index = index_from_model(model, population)
+    print(f"📈 Score index built from {len(index)} scores of {population}")
+    if identity['generation'] is None:
+        return index
+    try:
+        index.save(directory)
+    except OSError as e:
+        print(f"⚠️ Could not save the score index: {e}")
+        return index
+    # Reload so the array is a shared read-only mapping, as with the model artifacts
+    return ScoreIndex.load(directory, identity) or index
+
+
+def main(argv=None):
+    from model import InteractiveMLModel
+
+    parser = argparse.ArgumentParser(description='Build the portfolio percentile index from the served models')
+    parser.add_argument('population', nargs='?', default=DEFAULT_POPULATION,
+                        help='CSV with the 20 model features of the portfolio')
+    parser.add_argument('--artifact-dir', default=DEFAULT_ARTIFACT_DIR,
+                        help='artifact cache holding the models; the index is written next to them')
+    args = parser.parse_args(argv)
+
+    model = InteractiveMLModel()
+    model.load_or_train_models(args.artifact_dir)
+    index = index_from_model(model, args.population)
+    path = index.save(args.artifact_dir)
+    bands = ", ".join(f"{category} <= {edge:.4f}" for category, edge in zip(index.categories, index.edges))
+    print(f"✅ Indexed {len(index)} scores into {path} ({bands})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,416 @@
+# Lightweight inference engine for the trained tree ensembles
+# Flattens fitted scikit-learn forests / gradient boosting models into contiguous
+# NumPy node arrays so a row can be scored without sklearn's per-call overhead.
+# Scoring needs only NumPy; sklearn is imported when a model is compiled.
+
+import numpy as np
+
+# Upper bound on (rows x trees x outputs) gathered at once, keeps batch memory flat
+MAX_CHUNK_CELLS = 1 << 22
+
+
+class CompiledTreeEnsemble:
+    """Tree ensemble flattened into contiguous node arrays"""
+
+    def __init__(self, children, feature, threshold, value, roots, max_depth, classes,
+                 link='mean', init_raw=None, input_dtype=np.float32, cover=None, value_scale=None):
+        # children[2 * i] / children[2 * i + 1] are the left / right child of node i;
+        # leaves point back to themselves so every row can walk exactly max_depth steps
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.link = link
+        self.init_raw = init_raw
+        # Classic sklearn trees compare float32 inputs; histogram boosting compares float64
+        self.input_dtype = input_dtype
+        # Training samples (or weight) reaching each node, used by contributions()
+        self.cover = cover
+        # Set when value holds integer codes of the leaf values (see compaction.py)
+        self.value_scale = value_scale
+        self._expectations = None
+
+    def __getstate__(self):
+        # Explanation caches are rebuilt on first use instead of being saved in bundles
+        state = dict(self.__dict__, _expectations=None)
+        state.pop('_leaf_paths', None)
+        state.pop('_shap_cache', None)
+        return state
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """Leaf index reached in every tree for every row, shape (n_rows, n_trees)"""
+        X = np.asarray(X, dtype=self.input_dtype)
+        rows = np.arange(len(X))[:, None]
+        # Node ids are walked as intp: narrower stored indices (see compaction.py) would
+        # otherwise be converted again by every gather
+        node = np.repeat(self.roots[None, :].astype(np.intp), len(X), axis=0)
+        for _ in range(self.max_depth):
+            go_right = X[rows, self.feature[node]] > self.threshold[node]
+            node = self.children[2 * node + go_right].astype(np.intp, copy=False)
+        return node
+
+    def raw_predict(self, X):
+        """Summed leaf values (plus the boosting init score) for every row"""
+        n_rows = len(X)
+        out = np.empty((n_rows, self.value.shape[1]), dtype=np.float64)
+        chunk = max(1, MAX_CHUNK_CELLS // (self.n_trees * self.value.shape[1]))
+        for start in range(0, n_rows, chunk):
+            leaves = self.apply(X[start:start + chunk])
+            out[start:start + chunk] = self.value[leaves].sum(axis=1, dtype=np.float64)
+        if self.value_scale is not None:
+            out *= self.value_scale
+        if self.init_raw is not None:
+            out += self.init_raw
+        return out
+
+    def predict_proba(self, X):
+        """Class probabilities, matching the source model's predict_proba"""
+        return self.proba_from_raw(self.raw_predict(X))
+
+    def proba_from_raw(self, raw):
+        """Class probabilities of raw_predict output (overwritten in place for boosting)"""
+        if self.link == 'mean':
+            if self.value.dtype != np.float64:
+                # Rounded class fractions no longer add up to exactly one per leaf
+                return raw / raw.sum(axis=1, keepdims=True)
+            return raw / self.n_trees
+        if self.link == 'sigmoid':
+            from scipy.special import expit
+            proba = expit(raw[:, 0])
+            return np.column_stack([1 - proba, proba])
+        # softmax
+        raw -= raw.max(axis=1, keepdims=True)
+        np.exp(raw, out=raw)
+        raw /= raw.sum(axis=1, keepdims=True)
+        return raw
+
+    def predict(self, X):
+        """Predicted class labels"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def leaf_values(self):
+        """Node values as float64, decoded when they are stored as integer codes"""
+        value = self.value.astype(np.float64)
+        if self.value_scale is not None:
+            value *= self.value_scale
+        return value
+
+    def node_depths(self):
+        """Depth of every node below its tree's root (-1 for nodes no root reaches)"""
+        return _node_depths(self.children, self.roots, self.max_depth)
+
+    def node_expectations(self):
+        """Cover-weighted mean leaf value below every node (a leaf's own value for leaves)"""
+        if self._expectations is None:
+            if self.cover is None:
+                raise ValueError("Compiled ensemble has no node cover to explain with")
+            left, right = self.children[0::2], self.children[1::2]
+            nodes = np.arange(self.n_nodes)
+            internal = left != nodes
+            depth = self.node_depths()
+
+            expectations = self.leaf_values()
+            cover = self.cover.astype(np.float64)
+            # Children before parents: deepest internal nodes first
+            for level in range(self.max_depth - 1, -1, -1):
+                at_level = nodes[internal & (depth == level)]
+                l, r = left[at_level], right[at_level]
+                total = cover[l] + cover[r]
+                weights_l = np.divide(cover[l], total, out=np.full(len(at_level), 0.5), where=total > 0)
+                expectations[at_level] = (weights_l[:, None] * expectations[l]
+                                          + (1 - weights_l)[:, None] * expectations[r])
+                cover[at_level] = total
+            self._expectations = expectations
+        return self._expectations
+
+    def leaf_paths(self):
+        """Distinct features split on above every leaf, as groups of leaves with the same number of them
+
+        Each group is (leaves, feature, lower, upper, zero_fraction) with per-leaf
+        arrays of shape (n_leaves, width). A row follows a leaf's path on a feature
+        when lower < x <= upper; zero_fraction is the share of the training cover
+        that does (the product of child / parent cover along that feature's splits).
+        """
+        paths = getattr(self, '_leaf_paths', None)
+        if paths is None:
+            if self.cover is None:
+                raise ValueError("Compiled ensemble has no node cover to explain with")
+            left, right = self.children[0::2].astype(np.intp), self.children[1::2].astype(np.intp)
+            nodes = np.arange(self.n_nodes)
+            internal = left != nodes
+            depth = self.node_depths()
+            cover = self.cover.astype(np.float64)
+            n_features = int(self.feature[internal].max()) + 1 if internal.any() else 1
+
+            lower = np.full((self.n_nodes, n_features), -np.inf)
+            upper = np.full((self.n_nodes, n_features), np.inf)
+            fraction = np.ones((self.n_nodes, n_features))
+            on_path = np.zeros((self.n_nodes, n_features), dtype=bool)
+            # Parents before children: every level copies its bounds down and narrows the split feature's
+            for level in range(self.max_depth):
+                parents = nodes[internal & (depth == level)]
+                split = self.feature[parents].astype(np.intp)
+                threshold = self.threshold[parents].astype(np.float64)
+                for child, bound, narrow in ((left[parents], upper, np.minimum), (right[parents], lower, np.maximum)):
+                    for array in (lower, upper, fraction, on_path):
+                        array[child] = array[parents]
+                    bound[child, split] = narrow(bound[child, split], threshold)
+                    fraction[child, split] *= np.divide(cover[child], cover[parents], out=np.zeros(len(parents)),
+                                                        where=cover[parents] > 0)
+                    on_path[child, split] = True
+
+            leaves = nodes[~internal & (depth >= 0)]
+            widths = on_path[leaves].sum(axis=1)
+            paths = []
+            for width in np.unique(widths).tolist():
+                group = leaves[widths == width]
+                if width == 0:
+                    # A single-leaf tree: its value is the same for every row
+                    paths.append((group, np.zeros((len(group), 0), dtype=np.intp), np.zeros((len(group), 0)),
+                                  np.zeros((len(group), 0)), np.ones((len(group), 0))))
+                    continue
+                rows = group[:, None]
+                slots = np.argsort(~on_path[group], axis=1, kind='stable')[:, :width]
+                paths.append((group, slots, lower[rows, slots], upper[rows, slots], fraction[rows, slots]))
+            self._leaf_paths = paths
+        return paths
+
+    def _shap_groups(self):
+        """leaf_paths groups with their leaf values and quadrature points, plus the expected value"""
+        groups = getattr(self, '_shap_cache', None)
+        if groups is None:
+            values = self.leaf_values()
+            expected = np.zeros(values.shape[1])
+            groups = []
+            for leaves, feature, lower, upper, zero in self.leaf_paths():
+                expected += zero.prod(axis=1) @ values[leaves]
+                if feature.shape[1] == 0:
+                    continue
+                points, point_weights = np.polynomial.legendre.leggauss((feature.shape[1] + 1) // 2)
+                groups.append((feature, lower, upper, zero, values[leaves], (points + 1) / 2, point_weights / 2))
+            if self.init_raw is not None:
+                expected += self.init_raw
+            if self.link == 'mean':
+                expected /= self.n_trees
+            groups = self._shap_cache = (groups, expected)
+        return groups
+
+    def expected_value(self):
+        """Ensemble output for an input that is unknown: every tree's cover-weighted mean leaf value"""
+        return self._shap_groups()[1].copy()
+
+    def contributions(self, X, column=0):
+        """Exact per-feature Shapley values of every row for one output column (path-dependent TreeSHAP)
+
+        column is an output column index, or one index per row. Returns (base,
+        contributions) with shapes (n_rows,) and (n_rows, n_features); base +
+        contributions.sum(axis=1) equals that column of the ensemble output, i.e.
+        predict_proba for averaged forests and the raw margin for boosting.
+
+        Each leaf is a game over the features on its path: a coalition S reaches it
+        with weight prod(one_j for j in S) * prod(zero_j for j not in S). The Shapley
+        weights k! (w - 1 - k)! / w! are Beta integrals, so feature i's value is
+        (one_i - zero_i) * value * integral over [0, 1] of
+        prod_{j != i} (zero_j + (one_j - zero_j) * t) dt, a polynomial that
+        Gauss-Legendre quadrature integrates exactly with ceil(w / 2) points. All
+        rows and the leaves of one path width are handled at once.
+        """
+        groups, expected = self._shap_groups()
+        X = np.asarray(X, dtype=self.input_dtype)
+        n_rows, n_features = X.shape
+        column = np.broadcast_to(np.asarray(column, dtype=np.intp), (n_rows,))
+        out = np.zeros((n_rows, n_features), dtype=np.float64)
+
+        for feature, lower, upper, zero, leaf_values, points, point_weights in groups:
+            n_leaves, width = feature.shape
+            chunk = max(1, MAX_CHUNK_CELLS // (n_leaves * width * len(points)))
+            for start in range(0, n_rows, chunk):
+                block = X[start:start + chunk]
+                x = block[:, feature]
+                one = ((x > lower) & ~(x > upper)).astype(np.float64)
+
+                # Factors of every feature at every quadrature point: rows x leaves x points x width
+                factors = zero[:, None, :] + (one - zero)[:, :, None, :] * points[:, None]
+                # Product of all factors but feature i's, from running products from both ends
+                before = np.ones_like(factors)
+                np.cumprod(factors[..., :-1], axis=-1, out=before[..., 1:])
+                after = np.ones_like(factors)
+                np.cumprod(factors[..., :0:-1], axis=-1, out=after[..., -2::-1])
+                phi = np.einsum('rlpw,p->rlw', before * after, point_weights)
+                phi *= (one - zero) * leaf_values[:, column[start:start + chunk]].T[..., None]
+
+                rows = np.arange(len(block))[:, None, None]
+                out[start:start + len(block)] += np.bincount(
+                    (rows * n_features + feature).ravel(), weights=phi.ravel(),
+                    minlength=len(block) * n_features).reshape(len(block), n_features)
+
+        if self.link == 'mean':
+            out /= self.n_trees
+        return expected[column], out
+
+
+class CompiledScaler:
+    """StandardScaler.transform without sklearn's input validation"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        if self.mean_ is not None:
+            X -= self.mean_
+        if self.scale_ is not None:
+            X /= self.scale_
+        return X
+
+
+class _HistTreeView:
+    """Presents a HistGradientBoosting TreePredictor with the attributes of an sklearn Tree"""
+
+    def __init__(self, predictor):
+        nodes = predictor.nodes
+        is_leaf = nodes['is_leaf'].astype(bool)
+        self.node_count = len(nodes)
+        self.children_left = np.where(is_leaf, -1, nodes['left'].astype(np.intp))
+        self.children_right = np.where(is_leaf, -1, nodes['right'].astype(np.intp))
+        self.feature = nodes['feature_idx'].astype(np.intp)
+        self.threshold = nodes['num_threshold']
+        self.max_depth = predictor.get_max_depth()
+        self.leaf_value = nodes['value']
+        self.weighted_n_node_samples = nodes['count']
+
+
+def _node_depths(children, roots, max_depth):
+    """Depth of every node, walking down from the roots one level at a time (-1 if unreachable)"""
+    left, right = children[0::2], children[1::2]
+    internal = left != np.arange(len(left))
+    depth = np.full(len(left), -1, dtype=np.intp)
+    frontier = np.asarray(roots, dtype=np.intp)
+    depth[frontier] = 0
+    for level in range(1, max_depth + 1):
+        frontier = frontier[internal[frontier]]
+        frontier = np.concatenate([left[frontier], right[frontier]])
+        depth[frontier] = level
+    return depth
+
+
+def _flatten_trees(trees, n_outputs, value_of):
+    """Concatenate sklearn Tree objects into one set of node arrays"""
+    n_nodes = sum(tree.node_count for tree in trees)
+    children = np.empty(2 * n_nodes, dtype=np.intp)
+    feature = np.zeros(n_nodes, dtype=np.intp)
+    threshold = np.full(n_nodes, np.inf, dtype=np.float64)
+    value = np.zeros((n_nodes, n_outputs), dtype=np.float64)
+    roots = np.empty(len(trees), dtype=np.intp)
+    cover = np.empty(n_nodes, dtype=np.float64)
+
+    offset = 0
+    for t, tree in enumerate(trees):
+        count = tree.node_count
+        nodes = np.arange(offset, offset + count)
+        is_leaf = tree.children_left == -1
+
+        left = np.where(is_leaf, nodes, tree.children_left + offset)
+        right = np.where(is_leaf, nodes, tree.children_right + offset)
+        children[2 * offset:2 * (offset + count):2] = left
+        children[2 * offset + 1:2 * (offset + count):2] = right
+
+        feature[offset:offset + count] = np.where(is_leaf, 0, tree.feature)
+        threshold[offset:offset + count] = np.where(is_leaf, np.inf, tree.threshold)
+        value[offset:offset + count] = value_of(t, tree)
+        cover[offset:offset + count] = tree.weighted_n_node_samples
+
+        roots[t] = offset
+        offset += count
+
+    max_depth = max(tree.max_depth for tree in trees)
+    return children, feature, threshold, value, roots, max_depth, cover
+
+
+def compile_ensemble(model):
+    """Flatten a fitted tree ensemble; returns None for unsupported model types"""
+    from sklearn.dummy import DummyClassifier
+    from sklearn.ensemble import (RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier,
+                                  HistGradientBoostingClassifier)
+
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        if model.n_outputs_ != 1:
+            return None
+        trees = [estimator.tree_ for estimator in model.estimators_]
+
+        def value_of(t, tree):
+            # Normalise leaf class weights to the fractions each tree's predict_proba returns
+            value = tree.value[:, 0, :]
+            totals = value.sum(axis=1, keepdims=True)
+            return np.divide(value, totals, out=np.zeros_like(value), where=totals > 0)
+
+        *arrays, cover = _flatten_trees(trees, model.n_classes_, value_of)
+        return CompiledTreeEnsemble(*arrays, classes=model.classes_, link='mean', cover=cover)
+
+    if isinstance(model, GradientBoostingClassifier):
+        # Only a constant init score (prior or zero) can be folded into the arrays
+        if not (model.init_ == 'zero' or isinstance(model.init_, DummyClassifier)):
+            return None
+        n_stages, n_columns = model.estimators_.shape
+        trees = [model.estimators_[stage, k].tree_ for stage in range(n_stages) for k in range(n_columns)]
+
+        def value_of(t, tree):
+            # Each regression tree adds learning_rate * leaf value to its own class column
+            value = np.zeros((tree.node_count, n_columns), dtype=np.float64)
+            value[:, t % n_columns] = model.learning_rate * tree.value[:, 0, 0]
+            return value
+
+        *arrays, cover = _flatten_trees(trees, n_columns, value_of)
+        init_raw = model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0]
+        return CompiledTreeEnsemble(*arrays, classes=model.classes_,
+                                    link='softmax' if n_columns > 1 else 'sigmoid',
+                                    init_raw=np.asarray(init_raw, dtype=np.float64), cover=cover)
+
+    if isinstance(model, HistGradientBoostingClassifier):
+        # Categorical splits use bitsets, which the flat arrays don't model
+        if model.is_categorical_ is not None and np.any(model.is_categorical_):
+            return None
+        n_columns = model.n_trees_per_iteration_
+        trees = [_HistTreeView(predictor) for iteration in model._predictors for predictor in iteration]
+
+        def value_of(t, tree):
+            # Leaf values already include the learning rate; missing values can't reach
+            # the engine because inputs are validated before scoring
+            value = np.zeros((tree.node_count, n_columns), dtype=np.float64)
+            value[:, t % n_columns] = tree.leaf_value
+            return value
+
+        *arrays, cover = _flatten_trees(trees, n_columns, value_of)
+        return CompiledTreeEnsemble(*arrays, classes=model.classes_,
+                                    link='softmax' if n_columns > 1 else 'sigmoid',
+                                    init_raw=np.asarray(model._baseline_prediction, dtype=np.float64).ravel(),
+                                    input_dtype=np.float64, cover=cover)
+
+    return None
+
+
+def compile_scaler(scaler):
+    """Compile a fitted StandardScaler; returns None for other scalers"""
+    from sklearn.preprocessing import StandardScaler
+    if type(scaler) is not StandardScaler or not hasattr(scaler, 'n_features_in_'):
+        return None
+    # sklearn fits mean_ even when with_mean=False; only the enabled steps are applied
+    return CompiledScaler(scaler.mean_ if scaler.with_mean else None,
+                          scaler.scale_ if scaler.with_std else None)
+
+
+def check_parity(model, compiled, X):
+    """Largest absolute predict_proba difference between a model and its compiled form"""
+    return float(np.max(np.abs(model.predict_proba(X) - compiled.predict_proba(X))))